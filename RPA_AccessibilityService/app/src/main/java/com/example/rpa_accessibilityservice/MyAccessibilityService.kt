@@ -2,21 +2,62 @@ package com.example.rpa_accessibilityservice
 
 import android.accessibilityservice.AccessibilityService
 import android.content.Context
+import android.graphics.Rect
 import android.os.Handler
 import android.os.Looper
+import android.os.SystemClock
+import android.provider.Settings
 import android.util.Log
 import android.view.accessibility.AccessibilityEvent
 import android.view.accessibility.AccessibilityNodeInfo
+import org.json.JSONArray
+import org.json.JSONObject
 import java.io.*
+import java.security.MessageDigest
 import java.net.Socket
+import java.util.concurrent.ArrayBlockingQueue
+import java.util.concurrent.ConcurrentHashMap
+import java.util.concurrent.TimeUnit
+import java.util.concurrent.atomic.AtomicInteger
+import java.util.zip.Deflater
+import java.util.zip.DeflaterOutputStream
 
 class MyAccessibilityService : AccessibilityService() {
 
     private var socket: Socket? = null
-    private var writer: PrintWriter? = null
-    private var reader: BufferedReader? = null
+    private var output: DataOutputStream? = null
+    private var input: DataInputStream? = null
     private var isRunning = true
 
+    // Frame layout shared with the Python server (raspberry_pi/src/protocol.py):
+    // flags (1 byte) | request id (4 bytes) | body length (4 bytes) | UTF-8 JSON body
+    private val maxBodySize = 16 * 1024 * 1024
+    // Flag bits: a streamed reply is raw chunk frames (flagStream, maybe flagCompressed)
+    // followed by one JSON frame with the same request id that ends the stream
+    private val flagCompressed = 0x01
+    private val flagStream = 0x02
+    private val streamChunkSize = 16 * 1024
+
+    // Pushed to the server with request id 0 when the screen changes, see AsyncRobot.wait_for_ui
+    private val eventHandler = Handler(Looper.getMainLooper())
+    private val uiChangedInterval = 100L
+    @Volatile private var uiChangedPending = false
+    private val uiChangedNotice = Runnable {
+        uiChangedPending = false
+        sendMessage(0, JSONObject().put("event", "uiChanged"))
+    }
+
+    // Commands that asked to be acknowledged only once the screen has settled:
+    // request id -> (quiet window in ms, maximum wait in ms)
+    @Volatile private var lastUiEventAt = 0L
+    private val settleRequests = ConcurrentHashMap<Int, Pair<Long, Long>>()
+    // Commands whose reply carries the fingerprint of the settled screen, see AsyncRobot.scroll
+    private val fingerprintRequests = ConcurrentHashMap.newKeySet<Int>()
+
+    // Macro steps run as local requests with negative ids; their replies go here instead of the socket
+    private val macroStepIds = AtomicInteger(0)
+    private val localReplies = ConcurrentHashMap<Int, ArrayBlockingQueue<JSONObject>>()
+
     override fun onServiceConnected() {
         super.onServiceConnected()
         isRunning = true
@@ -39,16 +80,20 @@ class MyAccessibilityService : AccessibilityService() {
                 try {
                     Log.d("AccessibilityService", "Attempting to reconnect...")
                     socket = Socket(ip, port)
-                    writer = PrintWriter(BufferedWriter(OutputStreamWriter(socket?.getOutputStream())), true)
-                    reader = BufferedReader(InputStreamReader(socket?.getInputStream()))
+                    output = DataOutputStream(BufferedOutputStream(socket?.getOutputStream()))
+                    input = DataInputStream(BufferedInputStream(socket?.getInputStream()))
                     Log.d("AccessibilityService", "Reconnected to server: $ip:$port")
 
+                    // Handshake: tell the fleet server which device this is
+                    writeFrame(0, JSONObject().put("event", "hello").put("device_id", deviceId()))
+
 
                     while (isRunning) {
-                        val command = reader?.readLine()
-                        if (command != null) {
-                            Log.d("AccessibilityService", "Received command: $command")
-                            handleCommand(command)
+                        val frame = readFrame()
+                        if (frame != null) {
+                            val (requestId, message) = frame
+                            Log.d("AccessibilityService", "Received command #$requestId: ${message.optString("cmd")}")
+                            handleCommand(requestId, message)
                         } else {
                             Log.d("AccessibilityService", "Command is null, connection might be lost")
                             break
@@ -64,14 +109,20 @@ class MyAccessibilityService : AccessibilityService() {
         }.start()
     }
 
+    private fun deviceId(): String {
+        val sharedPreferences = getSharedPreferences("RPA_PREFS", Context.MODE_PRIVATE)
+        return sharedPreferences.getString("DEVICE_ID", null)
+            ?: Settings.Secure.getString(contentResolver, Settings.Secure.ANDROID_ID)
+    }
+
     private fun connectToServer(ip: String, port: Int) {
         attemptReconnect(ip, port)
     }
 
     private fun closeConnection() {
         try {
-            reader?.close()
-            writer?.close()
+            input?.close()
+            output?.close()
             socket?.close()
             socket = null
             Log.d("AccessibilityService", "Disconnected from server")
@@ -91,62 +142,101 @@ class MyAccessibilityService : AccessibilityService() {
     }
 
     override fun onAccessibilityEvent(event: AccessibilityEvent?) {
-        // Not used for this implementation
+        if (event == null || output == null) return
+        when (event.eventType) {
+            AccessibilityEvent.TYPE_WINDOW_CONTENT_CHANGED,
+            AccessibilityEvent.TYPE_WINDOW_STATE_CHANGED,
+            AccessibilityEvent.TYPE_VIEW_SCROLLED -> {
+                lastUiEventAt = SystemClock.uptimeMillis()
+                // Coalesce bursts of events into at most one notification per interval
+                if (!uiChangedPending) {
+                    uiChangedPending = true
+                    eventHandler.postDelayed(uiChangedNotice, uiChangedInterval)
+                }
+            }
+        }
     }
 
-    private fun handleCommand(command: String) {
+    private fun handleCommand(requestId: Int, message: JSONObject) {
+        val command = message.optString("cmd")
+        if (message.has("settle_ms")) {
+            settleRequests[requestId] = Pair(message.optLong("settle_ms"), message.optLong("timeout_ms", 5000L))
+        }
+        if (message.optBoolean("fingerprint")) {
+            fingerprintRequests.add(requestId)
+        }
         Thread {
             val rootNode = rootInActiveWindow
             if (rootNode == null) {
-                sendResponse("No active window found.")
+                sendResponse(requestId, "No active window found.")
                 return@Thread
             }
 
             when (command) {
                 "ping" -> {
-                    sendResponse("pong")
+                    sendResponse(requestId, "pong")
                 }
-                "goHome", "goBack", "showRecents" -> performGlobalActionByCommand(command)
-                "scrollUp", "scrollDown" -> performScroll(rootNode, command)
+                "goHome", "goBack", "showRecents" -> performGlobalActionByCommand(requestId, command)
+                "scrollUp", "scrollDown" -> performScroll(requestId, rootNode, command)
 
                 "getFullUI" -> {
                     val hierarchy = buildFullHierarchy(rootNode)
-                    sendLargeResponse(hierarchy)  // Send FullHierarchy to Python server
+                    val fingerprint = fingerprintOf(hierarchy)
+                    if (message.optBoolean("stream") && !localReplies.containsKey(requestId)) {
+                        sendStreamedResponse(requestId, hierarchy, message.optBoolean("compress"),
+                            JSONObject().put("fingerprint", fingerprint))
+                    } else {
+                        // One frame, however large the hierarchy is
+                        sendMessage(requestId, JSONObject().put("response", hierarchy).put("fingerprint", fingerprint))
+                    }
                 }
                 "clickBackButton" -> {
-                    clickBackButton(rootNode) // Handle back button click
+                    clickBackButton(requestId, rootNode) // Handle back button click
+                }
+                // Compact queries, so polling does not transfer the whole hierarchy
+                "exists" -> {
+                    val found = findNodeByPartialText(rootNode, message.optString("text")) != null
+                    sendMessage(requestId, JSONObject().put("response", found.toString()).put("found", found))
+                }
+                "queryUI" -> {
+                    val nodes = JSONArray()
+                    findNodesByPartialText(rootNode, message.optString("text"), message.optInt("limit", 20))
+                        .forEach { nodes.put(nodeToJson(it)) }
+                    sendMessage(requestId, JSONObject().put("response", "${nodes.length()} nodes").put("nodes", nodes))
                 }
+                // Ordered list of commands executed in one round trip
+                "macro" -> runMacro(requestId, message.optJSONArray("steps") ?: JSONArray(), message.optBoolean("stop_on_failure", true))
                 // Default behavior for finding and performing action
-                else -> findAndPerformActionOnMainThread(rootNode, command)
+                else -> findAndPerformActionOnMainThread(requestId, rootNode, command)
             }
         }.start()
     }
 
-    private fun performGlobalActionByCommand(command: String) {
+    private fun performGlobalActionByCommand(requestId: Int, command: String) {
         when (command) {
             "goHome" -> {
                 performGlobalAction(GLOBAL_ACTION_HOME)
-                sendResponse("Performed action: Home")
+                sendResponse(requestId, "Performed action: Home")
             }
             "goBack" -> {
                 performGlobalAction(GLOBAL_ACTION_BACK)
-                sendResponse("Performed action: Back")
+                sendResponse(requestId, "Performed action: Back")
             }
             "showRecents" -> {
                 performGlobalAction(GLOBAL_ACTION_RECENTS)
-                sendResponse("Performed action: Show Recent Apps")
+                sendResponse(requestId, "Performed action: Show Recent Apps")
             }
             else -> {
                 Log.e("AccessibilityService", "Invalid global action command: $command")
-                sendResponse("Invalid global action command: $command")
+                sendResponse(requestId, "Invalid global action command: $command")
             }
         }
     }
 
     // Helper to find and perform action on the main thread
-    private fun findAndPerformActionOnMainThread(rootNode: AccessibilityNodeInfo, command: String) {
+    private fun findAndPerformActionOnMainThread(requestId: Int, rootNode: AccessibilityNodeInfo, command: String) {
         Handler(Looper.getMainLooper()).post {
-            findAndPerformAction(rootNode, command)
+            findAndPerformAction(requestId, rootNode, command)
         }
     }
 
@@ -182,13 +272,16 @@ class MyAccessibilityService : AccessibilityService() {
         if (node == null) return sb.toString()
 
         val prefix = " ".repeat(depth * 2)
+        val bounds = Rect()
+        node.getBoundsInScreen(bounds)
         sb.append(
             "$prefix Node: ${node.className}," +
                     " Text: ${node.text}," +
                     " Clickable: ${node.isClickable}," +
                     " Visible: ${node.isVisibleToUser}," +
                     " Children: ${node.childCount}," +
-                    " Scrollable: ${node.isScrollable}\n"
+                    " Scrollable: ${node.isScrollable}," +
+                    " Bounds: ${bounds.toShortString()}\n"
         )
 
         for (i in 0 until node.childCount) {
@@ -198,17 +291,33 @@ class MyAccessibilityService : AccessibilityService() {
     }
 
 
+    // Cheap identity of a screen: the same hierarchy always gives the same fingerprint
+    private fun fingerprintOf(hierarchy: String): String {
+        val digest = MessageDigest.getInstance("SHA-1").digest(hierarchy.toByteArray(Charsets.UTF_8))
+        return digest.take(8).joinToString("") { "%02x".format(it) }
+    }
+
+    private fun screenFingerprint(): String? {
+        val rootNode = rootInActiveWindow ?: return null
+        return fingerprintOf(buildFullHierarchy(rootNode))
+    }
+
     private fun findNodeByPartialText(rootNode: AccessibilityNodeInfo, keyword: String): AccessibilityNodeInfo? {
+        return findNodesByPartialText(rootNode, keyword, 1).firstOrNull()
+    }
+
+    private fun findNodesByPartialText(rootNode: AccessibilityNodeInfo, keyword: String, limit: Int): List<AccessibilityNodeInfo> {
+        val matches = ArrayList<AccessibilityNodeInfo>()
         val queue = ArrayDeque<AccessibilityNodeInfo>()
         queue.add(rootNode)
 
-        while (queue.isNotEmpty()) {
+        while (queue.isNotEmpty() && matches.size < limit) {
             val node = queue.removeFirst()
 
             // use If want sensitive case
             // if (node.text?.contains(keyword, true) == true || node.contentDescription?.contains(keyword, true) == true) {
             if (node.text?.equals(keyword) == true) {
-                return node
+                matches.add(node)
             }
 
             // Add children to the queue
@@ -216,10 +325,23 @@ class MyAccessibilityService : AccessibilityService() {
                 node.getChild(i)?.let { queue.add(it) }
             }
         }
-        return null
+        return matches
     }
 
-    private fun findAndPerformAction(rootNode: AccessibilityNodeInfo, command: String) {
+    // Same fields as a line of buildFullHierarchy, see raspberry_pi/src/ui_tree.py
+    private fun nodeToJson(node: AccessibilityNodeInfo): JSONObject {
+        val bounds = Rect()
+        node.getBoundsInScreen(bounds)
+        return JSONObject()
+            .put("class_name", node.className?.toString())
+            .put("text", node.text?.toString())
+            .put("clickable", node.isClickable)
+            .put("visible", node.isVisibleToUser)
+            .put("scrollable", node.isScrollable)
+            .put("bounds", JSONArray(listOf(bounds.left, bounds.top, bounds.right, bounds.bottom)))
+    }
+
+    private fun findAndPerformAction(requestId: Int, rootNode: AccessibilityNodeInfo, command: String) {
         val targetNode = findNodeByPartialText(rootNode, command)
 
         if (targetNode != null) {
@@ -229,31 +351,32 @@ class MyAccessibilityService : AccessibilityService() {
             // Perform action if node is clickable
             if (targetNode.isClickable) {
                 targetNode.performAction(AccessibilityNodeInfo.ACTION_CLICK)
-                sendResponse("Command executed: $command")
+                sendResponse(requestId, "Command executed: $command")
 
                 // send FullHierarchy after Click
                 // val updatedHierarchy = buildFullHierarchy(rootInActiveWindow)
-                // sendResponse("Updated UI Hierarchy:\n$updatedHierarchy")
+                // sendResponse(requestId, "Updated UI Hierarchy:\n$updatedHierarchy")
             } else {
                 // Traverse up the hierarchy to find a clickable parent
                 var parentNode = targetNode.parent
                 while (parentNode != null) {
                     if (parentNode.isClickable) {
                         parentNode.performAction(AccessibilityNodeInfo.ACTION_CLICK)
-                        sendResponse("Command executed: $command via parent node")
+                        sendResponse(requestId, "Command executed: $command via parent node")
 
                         // send FullHierarchy after Click
                         //  val updatedHierarchy = buildFullHierarchy(rootInActiveWindow)
-                        //  sendResponse("Updated UI Hierarchy:\n$updatedHierarchy")
+                        //  sendResponse(requestId, "Updated UI Hierarchy:\n$updatedHierarchy")
                         return
                     }
                     parentNode = parentNode.parent
                 }
                 Log.e("AccessibilityService", "No clickable parent found for command: $command")
+                sendResponse(requestId, "No clickable parent found for command: $command")
             }
         } else {
             Log.e("AccessibilityService", "Command not found in UI: $command")
-            sendResponse("Command not found in UI: $command")
+            sendResponse(requestId, "Command not found in UI: $command")
         }
     }
 
@@ -268,21 +391,21 @@ class MyAccessibilityService : AccessibilityService() {
     }
 
     // If want to click only UI visible to user
-    private fun findAndPerformActionV2(rootNode: AccessibilityNodeInfo, command: String) {
+    private fun findAndPerformActionV2(requestId: Int, rootNode: AccessibilityNodeInfo, command: String) {
         val nodes = rootNode.findAccessibilityNodeInfosByText(command)
         if (nodes.isNotEmpty()) {
             val targetNode = nodes[0]
 
             if (targetNode.isVisibleToUser && targetNode.isClickable) {
                 targetNode.performAction(AccessibilityNodeInfo.ACTION_CLICK)
-                sendResponse("Command executed: $command")
+                sendResponse(requestId, "Command executed: $command")
             } else {
                 // Traverse up the hierarchy to find a clickable parent
                 var parentNode = targetNode.parent
                 while (parentNode != null) {
                     if (parentNode.isVisibleToUser && parentNode.isClickable) {
                         parentNode.performAction(AccessibilityNodeInfo.ACTION_CLICK)
-                        sendResponse("Command executed: $command via parent node")
+                        sendResponse(requestId, "Command executed: $command via parent node")
                         return
                     }
                     parentNode = parentNode.parent
@@ -294,7 +417,7 @@ class MyAccessibilityService : AccessibilityService() {
         }
     }
 
-    private fun clickBackButton(rootNode: AccessibilityNodeInfo) {
+    private fun clickBackButton(requestId: Int, rootNode: AccessibilityNodeInfo) {
         val queue = ArrayDeque<AccessibilityNodeInfo>()
         queue.add(rootNode)
 
@@ -308,7 +431,7 @@ class MyAccessibilityService : AccessibilityService() {
 
                 // send FullHierarchy after
                 // val updatedHierarchy = buildFullHierarchy(rootInActiveWindow)
-                sendResponse("Clicked Back Button.")
+                sendResponse(requestId, "Clicked Back Button.")
                 return
             }
 
@@ -318,16 +441,16 @@ class MyAccessibilityService : AccessibilityService() {
             }
         }
         Log.e("AccessibilityService", "Back Button (ImageButton) not found.")
-        sendResponse("Back Button (ImageButton) not found.")
+        sendResponse(requestId, "Back Button (ImageButton) not found.")
     }
 
-    private fun performScroll(rootNode: AccessibilityNodeInfo, direction: String) {
+    private fun performScroll(requestId: Int, rootNode: AccessibilityNodeInfo, direction: String) {
         try {
             val action = when (direction) {
                 "scrollUp" -> AccessibilityNodeInfo.ACTION_SCROLL_BACKWARD
                 "scrollDown" -> AccessibilityNodeInfo.ACTION_SCROLL_FORWARD
                 else -> {
-                    sendResponse("Invalid scroll command: $direction")
+                    sendResponse(requestId, "Invalid scroll command: $direction")
                     return
                 }
             }
@@ -352,48 +475,176 @@ class MyAccessibilityService : AccessibilityService() {
             }
 
             if (success) {
-                sendResponse("Scroll $direction completed successfully")
+                sendResponse(requestId, "Scroll $direction completed successfully")
             } else {
-                sendResponse("No scrollable node found")
+                sendResponse(requestId, "No scrollable node found")
             }
         } catch (e: Exception) {
-            sendResponse("Error executing scroll: ${e.message}")
+            sendResponse(requestId, "Error executing scroll: ${e.message}")
+        }
+    }
+
+    private fun readFrame(): Pair<Int, JSONObject>? {
+        val stream = input ?: return null
+        return try {
+            stream.readUnsignedByte()  // flags, unused for requests
+            val requestId = stream.readInt()
+            val length = stream.readInt()
+            if (length < 0 || length > maxBodySize) {
+                throw IOException("Invalid frame length: $length")
+            }
+            val body = ByteArray(length)
+            stream.readFully(body)
+            Pair(requestId, JSONObject(String(body, Charsets.UTF_8)))
+        } catch (e: EOFException) {
+            null
+        }
+    }
+
+    private fun writeFrame(requestId: Int, message: JSONObject) {
+        writeRawFrame(0, requestId, message.toString().toByteArray(Charsets.UTF_8))
+    }
+
+    private fun writeRawFrame(flags: Int, requestId: Int, body: ByteArray, length: Int = body.size) {
+        val stream = output ?: return
+        // Frames from several handler threads must never interleave on the socket
+        synchronized(stream) {
+            stream.writeByte(flags)
+            stream.writeInt(requestId)
+            stream.writeInt(length)
+            stream.write(body, 0, length)
+            stream.flush()
         }
     }
 
-    private fun sendResponse(response: String) {
+    // Send a large text in chunks so the server can parse it while it arrives.
+    // With compress, the chunks are one zlib stream, sync-flushed so every chunk decodes on its own.
+    private fun sendStreamedResponse(requestId: Int, text: String, compress: Boolean, final: JSONObject) {
         Thread {
             try {
-                writer?.println(response)
-                writer?.flush()
-                Log.d("AccessibilityService", "Response sent: $response")
+                val raw = text.toByteArray(Charsets.UTF_8)
+                val flags = flagStream or (if (compress) flagCompressed else 0)
+                var sent = 0
+                if (compress) {
+                    val chunk = ByteArrayOutputStream()
+                    val deflater = DeflaterOutputStream(chunk, Deflater(Deflater.BEST_SPEED), true)
+                    var offset = 0
+                    while (offset < raw.size) {
+                        val end = minOf(offset + streamChunkSize, raw.size)
+                        deflater.write(raw, offset, end - offset)
+                        deflater.flush()  // SYNC_FLUSH: the bytes so far form a decodable chunk
+                        writeRawFrame(flags, requestId, chunk.toByteArray())
+                        sent += chunk.size()
+                        chunk.reset()
+                        offset = end
+                    }
+                    deflater.close()
+                    if (chunk.size() > 0) {
+                        writeRawFrame(flags, requestId, chunk.toByteArray())
+                        sent += chunk.size()
+                    }
+                } else {
+                    var offset = 0
+                    while (offset < raw.size) {
+                        val end = minOf(offset + streamChunkSize, raw.size)
+                        writeRawFrame(flags, requestId, raw.copyOfRange(offset, end))
+                        offset = end
+                    }
+                    sent = raw.size
+                }
+                writeFrame(requestId, final
+                    .put("response", "")
+                    .put("streamed", true)
+                    .put("bytes", raw.size)
+                    .put("sent_bytes", sent))
+                Log.d("AccessibilityService", "Streamed #$requestId: ${raw.size} bytes as $sent")
             } catch (e: Exception) {
-                Log.e("AccessibilityService", "Error sending response: ${e.message}")
+                Log.e("AccessibilityService", "Error streaming response: ${e.message}")
             }
         }.start()
     }
 
-    private fun sendLargeResponse(response: String) {
-        val chunkSize = 4000  // 4KB chunk size
-        var index = 0
-        while (index < response.length) {
-            val chunk = response.substring(index, minOf(index + chunkSize, response.length))
-            sendResponseToSocket(chunk)  // Send the chunk
-            Thread.sleep(10)  // Slight delay to avoid socket overflow
-            index += chunkSize
-        }
-        sendResponseToSocket("[END]")  // Signal the end of the message
+    private fun sendResponse(requestId: Int, response: String) {
+        sendMessage(requestId, JSONObject().put("response", response))
     }
 
-    private fun sendResponseToSocket(chunk: String) {
-        try {
-            socket?.getOutputStream()?.let { outputStream ->
-                outputStream.write((chunk + "\n").toByteArray(Charsets.UTF_8))
-                outputStream.flush()
+    private fun runMacro(requestId: Int, steps: JSONArray, stopOnFailure: Boolean) {
+        val results = JSONArray()
+        var ok = true
+        for (i in 0 until steps.length()) {
+            val step = steps.getJSONObject(i)
+            val stepId = -1 - (macroStepIds.getAndIncrement() and 0x3FFFFFFF)
+            val reply = ArrayBlockingQueue<JSONObject>(1)
+            localReplies[stepId] = reply
+            handleCommand(stepId, step)
+            val result = reply.poll(step.optLong("timeout_ms", 5000L) + 30000L, TimeUnit.MILLISECONDS)
+                ?: JSONObject().put("response", "Step timed out").put("timed_out", true)
+            localReplies.remove(stepId)
+            result.put("cmd", step.optString("cmd"))
+            if (result.optBoolean("timed_out") || isFailedStep(result.optString("response"))) ok = false
+
+            // Optional wait condition: a text that must be on the screen before the next step
+            val waitFor = step.optString("wait_for", "")
+            if (waitFor.isNotEmpty()) {
+                val found = waitForText(waitFor, step.optLong("wait_timeout_ms", 10000L))
+                result.put("wait_for", waitFor).put("found", found)
+                if (!found) ok = false
             }
-            Log.d("AccessibilityService", "Chunk sent: $chunk")
-        } catch (e: Exception) {
-            Log.e("AccessibilityService", "Error sending chunk: ${e.message}")
+            results.put(result)
+            if (!ok && stopOnFailure) break
         }
+        sendMessage(requestId, JSONObject()
+            .put("response", if (ok) "Macro completed" else "Macro failed")
+            .put("ok", ok)
+            .put("results", results))
+    }
+
+    // Replies of click and clickBackButton when the element is missing
+    private fun isFailedStep(response: String): Boolean {
+        return response.startsWith("Command not found in UI") ||
+                response.startsWith("No clickable parent found") ||
+                response == "Back Button (ImageButton) not found."
+    }
+
+    private fun waitForText(text: String, timeoutMs: Long): Boolean {
+        val start = SystemClock.uptimeMillis()
+        while (SystemClock.uptimeMillis() - start < timeoutMs) {
+            val rootNode = rootInActiveWindow
+            if (rootNode != null && findNodeByPartialText(rootNode, text) != null) return true
+            Thread.sleep(100)
+        }
+        return false
+    }
+
+    // Wait until no UI event has arrived for the quiet window, or until the maximum wait
+    private fun waitForSettle(settleMs: Long, timeoutMs: Long): Boolean {
+        val actionAt = SystemClock.uptimeMillis()
+        while (true) {
+            val now = SystemClock.uptimeMillis()
+            if (now - maxOf(actionAt, lastUiEventAt) >= settleMs) return true
+            if (now - actionAt >= timeoutMs) return false
+            Thread.sleep(20)
+        }
+    }
+
+    private fun sendMessage(requestId: Int, message: JSONObject) {
+        Thread {
+            try {
+                settleRequests.remove(requestId)?.let { (settleMs, timeoutMs) ->
+                    message.put("settled", waitForSettle(settleMs, timeoutMs))
+                }
+                if (fingerprintRequests.remove(requestId)) {
+                    message.put("fingerprint", screenFingerprint())
+                }
+                localReplies[requestId]?.let {
+                    it.offer(message)
+                    return@Thread
+                }
+                writeFrame(requestId, message)
+                Log.d("AccessibilityService", "Response sent #$requestId: ${message.optString("response").take(200)}")
+            } catch (e: Exception) {
+                Log.e("AccessibilityService", "Error sending response: ${e.message}")
+            }
+        }.start()
     }
-}
\ No newline at end of file
+}
@@ -1,16 +1,19 @@
-from src import Robot, Sensor, Database, DustLogger
+from src import RobotFleet, SensorGroup, EarlyStopRule, Database, DatabaseWriter, Spool, SpoolReplayer, DustLogger, AsyncModbusSession
+from src.metrics import REGISTRY, MEASUREMENT_RETRIES, SURVEY_PHASE_SECONDS
+from src.storage import row
 
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+from contextlib import asynccontextmanager
 
 import os
 from dotenv import load_dotenv
 
-import threading
-import time
+import asyncio
+import functools
 
 import datetime
 
@@ -22,7 +25,34 @@ Start API server with this command:
 python -m uvicorn api.app:app --host 0.0.0.0 --port 8000
 """
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the robot fleet server on the API's event loop
+    await fleet.start_server()
+    writer.start()
+    # Rows spooled before a restart are replayed as soon as the database answers
+    replayer.start()
+    yield
+    # Stop a survey or trip still running, so it does not queue rows on a closed writer
+    stop_event.set()
+    for running_sensor in {sensor, *robot_sensors.values()}:
+        if running_sensor.is_measuring:
+            running_sensor.stop()
+    if robot_task is not None and not robot_task.done():
+        robot_task.cancel()
+        try:
+            await robot_task
+        except asyncio.CancelledError:
+            pass
+    # Rows still queued are written, or spooled, before the database pool closes
+    await writer.close()
+    await replayer.stop()
+    await fleet.stop_server()
+    AsyncModbusSession.close_all()
+    spool.close()
+    db.close()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,51 +62,73 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize robot, sensor, and database objects
-robot = Robot()
-sensor = Sensor()
+# Initialize robot fleet, sensor, and database objects
+fleet = RobotFleet()
+# The SOLAIRs measured at every point, SENSOR_GROUP="[name@]ip:slave,..."; SOLAIR_IP and SLAVE when unset
+sensor = SensorGroup.from_spec(os.getenv("SENSOR_GROUP"))
 db = Database()
+# Rows the database does not take are kept on disk (SPOOL_PATH) until it is back
+spool = Spool()
+replayer = SpoolReplayer(spool, {"DustMeasurements": db.save_measurement, "ActivityLogs": db.save_activity_log})
+writer = DatabaseWriter({
+    "DustMeasurements": functools.partial(replayer.write, "DustMeasurements"),
+    "ActivityLogs": functools.partial(replayer.write, "ActivityLogs"),
+})
 logger = DustLogger()
 
-# Start the robot server
-robot.start_server_in_background()
+# Robots that carry their own SOLAIRs, e.g. FLEET_SENSORS="robot-1=192.168.1.50:1,high@192.168.1.60:1;robot-2=192.168.1.51:1".
+# The SOLAIR samples the air where it is carried, so only these robots survey; without
+# FLEET_SENSORS, one robot surveys with the default sensors.
+robot_sensors = {}
+for entry in filter(None, os.getenv("FLEET_SENSORS", "").split(";")):
+    device_id, spec = entry.split("=", 1)
+    robot_sensors[device_id.strip()] = SensorGroup.from_spec(spec)
 
 # List to store destination points
 points = []
-dust_data_buffer = []
-activity_buffer = []
 ucl_limit = int(os.getenv("UCL_LIMIT"))
 max_retries = int(os.getenv("MAX_RETRIES", 3))
 max_wait = int(os.getenv("MAX_WAIT", 120))
+# Ends a measurement as soon as um03 is decided against UCL_LIMIT, see EARLY_STOP (off by default)
+early_stop = EarlyStopRule(ucl_limit)
 
-# Thread
-stop_event = threading.Event()
-lock = threading.Lock()
-robot_thread = None  # Store the robot's thread
+# Task
+stop_event = asyncio.Event()
+lock = asyncio.Lock()
+robot_task = None  # Store the robot's task
 
 @app.get("/check-robot-connection")
 async def check_robot_connection():
     """
     Check if the robot is connected.
-    returns True if the robot is connected, otherwise False.
+    returns True if at least one robot is connected, otherwise False,
+    with the connection state and the time each robot was last heard from.
     """
-    if robot.is_client_connected():
+    if fleet.connected_robots():
         return JSONResponse(
-                content={"message": "True"},
+                content={"message": "True", "robots": fleet.state()},
                 status_code=200 
             )
     return JSONResponse(
-                content={"message": "False"},
+                content={"message": "False", "robots": fleet.state()},
                 status_code=200 
             )
 
+@app.get("/metrics")
+async def metrics():
+    """
+    Command latency, bytes, retries, lock waits, Modbus and SQL timings and survey phase times,
+    in the Prometheus text format.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/check-sensor-connection")
 async def check_sensor_connection():
     """
     Check if the sensor is connected.
     returns True if the sensor is connected and measuring, otherwise False.
     """
-    if sensor.is_measuring or sensor.is_sensor_connected():
+    if sensor.is_measuring or await sensor.is_sensor_connected():
         return JSONResponse(
                     content={"message": "True"},
                     status_code=200 
@@ -93,7 +145,7 @@ async def check_database_connection():
     Check if the database is connected.
     returns True if the database is connected, otherwise False.
     """
-    if db.is_database_connected():
+    if await asyncio.to_thread(db.is_database_connected):
         return JSONResponse(
                     content={"message": "True"},
                     status_code=200 
@@ -128,7 +180,7 @@ async def add_points(data: ListPointsRequest):
     **Response**:
     - A message indicating the points that were added and The current list of destination points.
     """
-    with lock:
+    async with lock:
         points.extend(data.points)
     print(f"Added {data.points} to the queue.")
     return JSONResponse(
@@ -169,93 +221,115 @@ async def del_points():
             )
     
 
-def save_activity_log_safe(activity):
-    try:
-        db.save_activity_log(activity)
-        print(f"Saved activity log at {activity[1]}")
-    except Exception as e:
-        activity_buffer.append(activity)
-        print(f"Database error: {e}. Storing offline.")
+async def save_activity_log_safe(activity):
+    # Queued for the writer, the survey does not wait for SQL Server
+    await writer.put("ActivityLogs", activity)
 
 
-def save_measurement_safe(dust_data):
-    tuple_dust_data = tuple(dust_data.values())
-    try:
-        db.save_measurement(tuple_dust_data)
-        print(f"Saved dust data at {dust_data['location_name']}")
-    except Exception as e:
-        dust_data_buffer.append(tuple_dust_data)
-        print(f"DB error: {e}")
+async def save_measurement_safe(records):
+    # The records of every sensor at a point are queued together and land in one batch
+    for dust_data in records:
+        await writer.put("DustMeasurements", row("DustMeasurements", dust_data))
+    print(f"Queued dust data at {records[0]['location_name']}")
 
-    try:
-        logger.save_measurement_log(dust_data)
-    except Exception as e:
-        print(f"Log error: {e}")
+    for dust_data in records:
+        try:
+            logger.save_measurement_log(dust_data)
+        except Exception as e:
+            print(f"Log error: {e}")
+
+
+def sensor_for(robot):
+    """Return the sensors carried by a robot"""
+    return robot_sensors.get(robot.device_id, sensor)
+
+
+def survey_robots():
+    """Connected robots that carry sensors: those in FLEET_SENSORS, or else a single robot"""
+    robots = fleet.connected_robots()
+    if robot_sensors:
+        return [robot for robot in robots if robot.device_id in robot_sensors]
+    return robots[:1]
 
 
-def perform_dust_measurement(point, required_send_database):
+async def perform_dust_measurement(point, required_send_database, sensor=sensor):
     for count in range(1, max_retries + 1):
+        if count > 1:
+            MEASUREMENT_RETRIES.inc()
         print(f"Start measurement at point: {point} count: {count}/{max_retries}...")
         
-        save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Measuring start {count}/{max_retries}]"))
+        await save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Measuring start {count}/{max_retries}]"))
         
+        def progress(elapsed, total):
+            print(f"Measuring at {point}: {elapsed:.0f}/{total}s")
+
+        def on_sample(elapsed, record):
+            print(f"Live um03 at {point}: {record['um03']} after {elapsed:.0f}s")
+
         try:
-            sensor.start_measurement()
-            dust_data = sensor.read_data()
+            records = await sensor.measure(progress, early_stop, on_sample)
         except Exception as e:
             print(f"Sensor error: {e}")
             continue
 
-        save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Measuring finish {count}/{max_retries}]"))
+        if records is None:
+            if stop_event.is_set() or sensor.stopped:
+                return  # Cancelled by /stop-dust
+            print(f"No data from sensor at {point}")
+            continue
+
+        await save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Measuring finish {count}/{max_retries}]"))
+        if sensor.primary.decision is not None:
+            # The record is stored as read: it covers the shorter sample
+            await save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point,
+                                          f"Early stop {sensor.primary.decision} after {sensor.primary.decided_after:.0f}/{sensor.primary.measurement_time}s"))
 
-        dust_data['location_name'] = point
-        dust_data['count'] = count
+        sensor.locate(records, point)
+        for record in records:
+            record['count'] = count
+            record['alarm_high'] = 1 if record['um03'] > ucl_limit else 0
+
+        # The primary sensor decides the result at the point
+        dust_data = records[0]
         um03 = dust_data.get('um03', 0)
 
         if um03 > ucl_limit:
-            dust_data['alarm_high'] = 1
-            save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, "Result NG"))
+            await save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, "Result NG"))
             print(f"Dust level at {point} exceeded UCL ({um03}). Retrying ...")
         else:
-            dust_data['alarm_high'] = 0
-            save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, "Result OK"))
+            await save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, "Result OK"))
 
-        print(dust_data)
+        for record in records:
+            print(record)
 
         if required_send_database:
-            save_measurement_safe(dust_data)
-            save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Save data to database"))
+            await save_measurement_safe(records)
+            await save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Save data to database"))
         
         if um03 <= ucl_limit:
             break
 
-        time.sleep(2)
-
+        await asyncio.sleep(2)
 
-def start_dust_task(required_send_database):
-    global stop_event, points, dust_data_buffer, activity_buffer
 
-    if not points:
-        print("No points in queue.")
-        return
+async def dust_survey_worker(robot, required_send_database):
+    """Visit points from the shared queue with one robot until the queue is empty"""
+    await robot.run_macro("open_delivery")
 
-    robot.send_command("goHome")
-    time.sleep(1)
-    robot.send_command("Peanut Food Delivery")
-    time.sleep(2)
-
-    while points:
+    while True:
         if stop_event.is_set():
             print("Interrupted: Stopping robot process...")
             return
 
-        with lock:
+        async with lock:
+            if not points:
+                break
             point = points.pop(0)
 
-        robot.send_command("clickBackButton")
-        robot.send_command("Direct")
-
-        if not robot.search_ui_and_click(point):
+        with SURVEY_PHASE_SECONDS.time(device=robot.label(), phase="navigate"):
+            await robot.run_macro("open_direct")
+            found = await robot.search_ui_and_click(point)
+        if not found:
             print(f"No point found, skip {point}")
             continue
 
@@ -263,43 +337,47 @@ def start_dust_task(required_send_database):
             print("Interrupted: Stopping robot process...")
             return
 
-        robot.send_command("Go")
+        await robot.send_command("Go")
         print(f"Robot is going to {point}...")
-        save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Going to [{point}]"))
+        await save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Going to [{point}]"))
 
-        now_sec = 0
-        while not robot.is_have_ui("Go"):
+        # Resumes as soon as the device reports the "Go" button
+        with SURVEY_PHASE_SECONDS.time(device=robot.label(), phase="travel"):
+            arrived = await robot.wait_for_ui("Go", timeout=max_wait, stop_event=stop_event)
+        if not arrived:
             if stop_event.is_set():
                 print("Interrupted: Stopping robot process...")
                 return
-            time.sleep(1)
-            now_sec += 1
-            print(f"Waiting {now_sec}/{max_wait}")
-            if now_sec >= max_wait:
-                print("Timeout")
-                break
+            print("Timeout")
 
         print(f"Robot at point: {point}")
-        save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Robot at [{point}]"))
+        await save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Robot at [{point}]"))
 
-        perform_dust_measurement(point, required_send_database)
+        with SURVEY_PHASE_SECONDS.time(device=robot.label(), phase="measure"):
+            await perform_dust_measurement(point, required_send_database, sensor_for(robot))
         print(f"Finished point: {point}")
 
-    if dust_data_buffer:
-        print("Retrying to save measurements...")
-        try:
-            db.save_measurement(dust_data_buffer)
-            dust_data_buffer.clear()
-        except Exception as e:
-            print(f"Still unable to save measurements: {e}")
 
-    if activity_buffer:
-        print("Retrying to save activity logs...")
-        try:
-            db.save_activity_log(activity_buffer)
-            activity_buffer.clear()
-        except Exception as e:
-            print(f"Still unable to save activity logs: {e}")
+async def start_dust_task(required_send_database):
+    global stop_event, points
+
+    if not points:
+        print("No points in queue.")
+        return
+
+    # Every robot carrying sensors takes points from the same queue, so they survey in parallel
+    results = await fleet.dispatch(lambda robot: dust_survey_worker(robot, required_send_database), survey_robots())
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Robot error: {result}")
+
+    if stop_event.is_set():
+        return
+
+    # Rows the database did not take are on the spool; the replayer sends them when it can
+    await writer.flush()
+    if spool.depth():
+        print(f"{spool.depth()} rows spooled until the database is reachable.")
 
     print("All measurements completed.")
 
@@ -320,10 +398,10 @@ async def start_dust(request: OperationRequest):
 
     **Response**: A message indicating the robot process has started.
     """
-    global robot_thread, stop_event
+    global robot_task, stop_event
 
-    with lock:
-        if robot_thread is not None and robot_thread.is_alive():
+    async with lock:
+        if robot_task is not None and not robot_task.done():
             return JSONResponse(
                 content={"message": "Robot process is already running."},
                 status_code=400
@@ -335,19 +413,27 @@ async def start_dust(request: OperationRequest):
             status_code=400
         )
         
-    if not robot.is_client_connected():
+    if not fleet.connected_robots():
          return JSONResponse(
             content={"message": "Robot not connect"},
             status_code=400
         )
-    
-    if not sensor.is_sensor_connected():
+
+    robots = survey_robots()
+    if not robots:
          return JSONResponse(
-            content={"message": "Sensor not connect"},
+            content={"message": "No connected robot has sensors in FLEET_SENSORS"},
             status_code=400
         )
+
+    for robot_sensor in {sensor_for(robot) for robot in robots}:
+        if not await robot_sensor.is_sensor_connected():
+            return JSONResponse(
+                content={"message": "Sensor not connect"},
+                status_code=400
+            )
          
-    if not db.is_database_connected():
+    if not await asyncio.to_thread(db.is_database_connected):
          return JSONResponse(
             content={"message": "Database not connect"},
             status_code=400
@@ -355,12 +441,7 @@ async def start_dust(request: OperationRequest):
          
     stop_event.clear()
 
-    robot_thread = threading.Thread(
-        target=start_dust_task,
-        args=(request.required_send_database,),  
-        daemon=True
-    )
-    robot_thread.start()
+    robot_task = asyncio.create_task(start_dust_task(request.required_send_database))
 
     return JSONResponse(
         content={"message": "Robot process started."},
@@ -378,16 +459,17 @@ async def stop_dust():
     
     **Response**: A message indicating the robot process is being stopped or that no process is running.
     """
-    global robot_thread, stop_event
+    global robot_task, stop_event
 
-    # Stop the sensor measurement if it's running
-    if sensor.is_measuring:
-        sensor.stop_measurement()
-        print("Sensor measurement stopped.")
+    # Cancel the sensor measurements that are running; each writes the stop register as it ends
+    for running_sensor in {sensor, *robot_sensors.values()}:
+        if running_sensor.is_measuring:
+            running_sensor.stop()
+            print("Sensor measurement stopped.")
 
     # Check if the robot process has already started
-    with lock: 
-        if robot_thread is None or not robot_thread.is_alive():
+    async with lock: 
+        if robot_task is None or robot_task.done():
             return JSONResponse(
                 content={"message": "No active robot process to stop."},
                 status_code=400 # Return a 400 Bad Request if not running
@@ -401,64 +483,115 @@ async def stop_dust():
             )
 
 
-def start_transportation_task():
+class BackfillRequest(BaseModel):
+    since: Optional[str] = None  # "YYYY-MM-DD HH:MM:SS"; only records after it are read back
+    limit: Optional[int] = None  # At most this many of the newest records
+
+@app.post("/backfill-dust")
+async def backfill_dust(request: BackfillRequest):
+    """
+    Recover measurements from the records stored on the SOLAIR.
+
+    Measurements taken while the network or the database was down are still in the sensor's
+    record buffer. This endpoint reads them back, oldest first, and spools them in one batch.
+    The spool replayer inserts them, skipping records the database already has: a row is
+    keyed by the sensor and the record's raw timestamp, which the live rows store as well.
+
+    **Request body**:
+    - **since**: Only read records newer than this time, on the sensor clock like the times
+      the recovered rows are stored with. Example: "2024-05-01 08:00:00"
+    - **limit**: Read at most this many records, newest first.
+
+    **Response**: The number of records read back and the recovered rows.
+    """
+    if robot_task is not None and not robot_task.done():
+        return JSONResponse(
+                    content={"message": "Robot process is running. Backfill after it ends."},
+                    status_code=400
+                )
+    try:
+        since = datetime.datetime.strptime(request.since, '%Y-%m-%d %H:%M:%S') if request.since else None
+    except ValueError:
+        return JSONResponse(
+                    content={"message": f"Invalid since {request.since!r}, expected YYYY-MM-DD HH:MM:SS."},
+                    status_code=400
+                )
+    try:
+        records = await sensor.backfill(since, request.limit)
+    except RuntimeError as e:
+        return JSONResponse(content={"message": str(e)}, status_code=400)
+
+    if records:
+        await asyncio.to_thread(spool.append, "DustMeasurements", [row("DustMeasurements", record) for record in records])
+    print(f"Backfilled {len(records)} records from the sensor.")
+    return JSONResponse(
+                content={"message": f"Backfilled {len(records)} records.", "records": records},
+                status_code=200
+            )
+
+
+async def start_transportation_task():
     """
         Task to move the robot through all points in the queue.
         This function will:
         
     """
-    global stop_event, points, activity_buffer
+    global stop_event, points
 
     if not points:
         print("No points in queue.")
         return
 
-    robot.send_command("goHome")
-    time.sleep(1)
-    robot.send_command("Peanut Food Delivery")
-    time.sleep(2)
+    # A multi-stop delivery is a single robot's trip
+    robot = fleet.primary()
+    if robot is None:
+        print("No robot connected.")
+        return
+
+    async with robot.locked():
+        await transportation_trip(robot)
+
+
+async def transportation_trip(robot):
+    """Select every queued point as a stop on one robot and follow it to each of them"""
+    await robot.run_macro("open_delivery")
 
     if stop_event.is_set():
         print("Interrupted: Stopping robot process...")
         return
 
-    robot.send_command("clickBackButton")
-    robot.send_command("Direct")
+    await robot.run_macro("open_direct")
 
-    for point in points:
-        with lock:
-            if not robot.search_ui_and_click(point):
+    # Select every stop in one sweep of the point list; the trip follows the order they were selected in
+    async with lock:
+        selected = await robot.search_ui_and_click_all(points)
+        for point in points:
+            if point not in selected:
                 print(f"No point found, skip {point}")
-                continue
+        points[:] = selected
 
     if stop_event.is_set():
         print("Interrupted: Stopping robot process...")
         return
 
-    robot.send_command("Go")
+    await robot.send_command("Go")
     
     while points:
         point = points.pop(0)
         print(f"Robot is going to {point}...")
-        save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Going to [{point}]"))
+        await save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Going to [{point}]"))
 
-        now_sec = 0
-        while not robot.is_have_ui("OK"):
+        # Resumes as soon as the device reports the "OK" button
+        if not await robot.wait_for_ui("OK", timeout=max_wait, stop_event=stop_event):
             if stop_event.is_set():
                 print("Interrupted: Stopping robot process...")
                 return
-            time.sleep(1)
-            now_sec += 1
-            print(f"Waiting {now_sec}/{max_wait}")
-            if now_sec >= max_wait:
-                print("Timeout")
-                break
+            print("Timeout")
 
         print(f"Robot at point: {point}")
-        save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Robot at [{point}]"))
+        await save_activity_log_safe((datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'), point, f"Robot at [{point}]"))
         
-        while robot.is_have_ui("OK"):
-            time.sleep(1)
+        await robot.wait_for_ui(lambda ui: not ui.has("OK"), stop_event=stop_event)
 
 
 @app.post("/start-transportation")
@@ -468,10 +601,10 @@ async def start_transportation():
  
     **Response**: A message indicating the robot process has started.
     """
-    global robot_thread, stop_event
+    global robot_task, stop_event
 
-    with lock:
-        if robot_thread is not None and robot_thread.is_alive():
+    async with lock:
+        if robot_task is not None and not robot_task.done():
             return JSONResponse(
                 content={"message": "Robot process is already running."},
                 status_code=400
@@ -483,13 +616,13 @@ async def start_transportation():
             status_code=400
         )
         
-    if not robot.is_client_connected():
+    if not fleet.connected_robots():
         return JSONResponse(
             content={"message": "Robot not connect"},
             status_code=400
         )
     
-    if not db.is_database_connected():
+    if not await asyncio.to_thread(db.is_database_connected):
         return JSONResponse(
             content={"message": "Database not connect"},
             status_code=400
@@ -497,11 +630,7 @@ async def start_transportation():
 
     stop_event.clear()
 
-    robot_thread = threading.Thread(
-        target=start_transportation_task,
-        daemon=True
-    )
-    robot_thread.start()
+    robot_task = asyncio.create_task(start_transportation_task())
 
     return JSONResponse(
         content={"message": "Robot process started."},
@@ -518,11 +647,11 @@ async def stop_transportation():
     
     **Response**: A message indicating the robot process is being stopped or that no process is running.
     """
-    global robot_thread, stop_event
+    global robot_task, stop_event
 
     # Check if the robot process has already started
-    with lock: 
-        if robot_thread is None or not robot_thread.is_alive():
+    async with lock: 
+        if robot_task is None or robot_task.done():
             return JSONResponse(
                 content={"message": "No active robot process to stop."},
                 status_code=400 # Return a 400 Bad Request if not running
@@ -1,4 +1,16 @@
 from .dust_log import DustLogger
 from .robot import Robot
+from .async_robot import AsyncRobot
+from .fleet import RobotFleet
+from .macros import MACROS
+from .ui_tree import UINode, UITree, UITreeStreamParser
+from .modbus_session import ModbusSession, AsyncModbusSession
 from .sensor import Sensor
-from .database import Database
\ No newline at end of file
+from .measurement import MeasurementEngine, EarlyStopRule
+from .sensor_group import SensorGroup
+from .storage import Storage
+from .mssql_storage import MSSQLStorage
+from .sqlite_storage import SQLiteStorage
+from .database import Database
+from .db_writer import DatabaseWriter
+from .spool import Spool, SpoolReplayer
@@ -0,0 +1,540 @@
+import asyncio
+import contextlib
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+import os
+
+from .connection import ConnectionState, enable_keepalive
+from .macros import MACROS
+from .metrics import ROBOT_LOCK_WAIT_SECONDS, ROBOT_REQUEST_FAILURES, ROBOT_REQUEST_SECONDS, ROBOT_SCROLLS, command_label
+from .protocol import AsyncDispatcher
+from .scroll_index import ScrollIndex
+from .ui_tree import UINode, UITree, UITreeStreamParser
+
+# Load configuration from .env file
+load_dotenv()
+
+# Commands that only read from the device; every other command may change the screen
+READ_ONLY_COMMANDS = {"ping", "getFullUI", "exists", "queryUI"}
+MAX_SCROLLS = 10  # Extra scrolls per direction when scanning a list
+STOP_CHECK_INTERVAL = 0.5  # How often wait_for_ui looks at its stop event
+SCREEN_CACHE_SIZE = 32  # Parsed screens kept by fingerprint, enough for a few lists of points
+
+class AsyncRobot:
+    def __init__(self, device_id=None, scroll_index=None):
+        """Initialize the robot server with settings from .env file"""
+        self.device_id = device_id
+        self.server_bind = os.getenv("RPA_BIND", "0.0.0.0")
+        self.server_port = int(os.getenv("RPA_PORT", 12345))
+        self.ping_timeout = float(os.getenv("RPA_PING_TIMEOUT", 5))
+        self.command_timeout = float(os.getenv("RPA_COMMAND_TIMEOUT", 30))
+        # Commands that change the screen are acknowledged once no UI event arrived for settle_time,
+        # or after settle_timeout at the latest
+        self.settle_time = float(os.getenv("RPA_SETTLE_TIME", 0.3))
+        self.settle_timeout = float(os.getenv("RPA_SETTLE_TIMEOUT", 5))
+        self.compress_ui = os.getenv("RPA_COMPRESS_UI", "true").lower() == "true"
+        self.heartbeat_interval = float(os.getenv("RPA_HEARTBEAT", 10))
+        # Re-check wait_for_ui conditions at least this often, in case a push notification is lost
+        self.ui_resync_interval = float(os.getenv("RPA_UI_RESYNC", 10))
+        self.server = None
+        self.dispatcher = None
+        self.heartbeat_task = None
+        self.connected = asyncio.Event()
+        self.ui_tree = None  # Parsed UI of the current screen, None when it may be stale
+        self.fingerprint = None  # Device hash of the current screen, None when unknown
+        self.screen_cache = OrderedDict()  # fingerprint -> UITree of screens seen before
+        self.scroll_index = scroll_index or ScrollIndex()
+        self.lock = asyncio.Lock()  # Held by whoever drives this robot through a survey
+        self.ui_changed = asyncio.Event()  # Set and replaced whenever the device reports a UI change
+        # The link is healthy while frames keep arriving; the heartbeat only pings an idle link
+        self.connection = ConnectionState(stale_after=2 * self.heartbeat_interval + self.ping_timeout)
+
+
+    async def start_server(self):
+        """Start the TCP server and the heartbeat on the running event loop"""
+        self.server = await asyncio.start_server(self.attach, self.server_bind, self.server_port)
+        print(f"Server listening on {self.server_bind}:{self.server_port}")
+        print("Waiting for Android device to connect...")
+        self.start_heartbeat()
+
+    def start_heartbeat(self):
+        """Start the heartbeat task if it is not running yet"""
+        if self.heartbeat_task is None or self.heartbeat_task.done():
+            self.heartbeat_task = asyncio.create_task(self.heartbeat())
+
+    async def stop_server(self):
+        """Stop the heartbeat, drop the client and close the TCP server"""
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+        self.cleanup_client()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def attach(self, reader, writer):
+        """Serve a device connection until it closes, replacing any previous one"""
+        addr = writer.get_extra_info("peername")
+        if self.dispatcher is not None:
+            print("New Android device connected, dropping the previous one")
+            self.cleanup_client()
+        enable_keepalive(writer.get_extra_info("socket"))
+        dispatcher = AsyncDispatcher(reader, writer, on_event=self.__handle_event,
+                                     on_activity=self.connection.on_activity)
+        self.dispatcher = dispatcher
+        self.connection.on_connect(addr)
+        self.connected.set()
+        print(f"Connected to Android device at {addr}")
+        try:
+            await dispatcher.run()
+        except asyncio.CancelledError:
+            return  # Event loop is shutting down
+        if self.dispatcher is dispatcher:
+            print("Client disconnected, waiting for reconnect...")
+            self.cleanup_client()
+
+    def __handle_event(self, message):
+        """Handle a message pushed by the device"""
+        if message.get("event") == "uiChanged":
+            ui_changed, self.ui_changed = self.ui_changed, asyncio.Event()
+            ui_changed.set()
+        elif message.get("event") == "hello":
+            self.device_id = message.get("device_id") or self.device_id
+
+    async def heartbeat(self):
+        """Ping the client when the link has been idle and drop it when it stops answering"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)  # Hearthbeat time
+            if self.dispatcher is None:
+                continue
+            if self.connection.idle_seconds() < self.heartbeat_interval:
+                continue  # Recent replies already prove the link is alive
+            if not await self.ping():
+                print("Client disconnected, waiting for reconnect...")
+                self.cleanup_client()
+
+    async def ping(self):
+        """Actively check the link with a ping/pong round trip"""
+        if self.dispatcher is None:
+            return False
+        try:
+            response = await self.dispatcher.request({"cmd": "ping"}, timeout=self.ping_timeout)
+            return response.get("response") == "pong"
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            self.connection.on_failure(str(e) or "Ping timeout")
+            return False
+        except Exception as e:
+            self.connection.on_failure(e)
+            return False
+
+    async def is_client_connected(self):
+        """Check if the client is connected and has been heard from recently, without a round trip"""
+        return self.dispatcher is not None and self.connection.is_healthy()
+
+    def connection_state(self):
+        """Connection state and last-seen time for the API"""
+        return self.connection.as_dict()
+
+    def cleanup_client(self):
+        """Close and reset client connection"""
+        if self.dispatcher:
+            self.dispatcher.close()
+        self.dispatcher = None
+        self.connection.on_disconnect()
+        self.connected.clear()
+        self.ui_tree = None
+        self.fingerprint = None
+
+    def label(self):
+        """Name of this robot in metrics"""
+        return self.device_id or "default"
+
+    @contextlib.asynccontextmanager
+    async def locked(self):
+        """Hold the robot's lock for a task, recording how long the task waited for it"""
+        start = time.perf_counter()
+        async with self.lock:
+            ROBOT_LOCK_WAIT_SECONDS.observe(time.perf_counter() - start, device=self.label())
+            yield self
+
+    async def __wait_dispatcher(self):
+        """Return the dispatcher of the connected device, waiting for a device if there is none"""
+        while self.dispatcher is None:
+            print("Robot is not connected waiting for reconnect")
+            await self.connected.wait()
+        return self.dispatcher
+
+    def __request_failed(self, error, dispatcher, command):
+        """Record a failed request and drop the link if sending or receiving failed"""
+        if isinstance(error, asyncio.TimeoutError):
+            print(f"No reply to {command} within the timeout")
+            ROBOT_REQUEST_FAILURES.inc(device=self.label(), command=command_label(command), reason="timeout")
+            self.connection.on_failure(f"Timeout: {command}")
+            return
+        print(f"Error handling client: {error}")
+        reason = "connection" if isinstance(error, ConnectionError) else "error"
+        ROBOT_REQUEST_FAILURES.inc(device=self.label(), command=command_label(command), reason=reason)
+        self.connection.on_failure(error)
+        if isinstance(error, ConnectionError) and dispatcher is not None and self.dispatcher is dispatcher:
+            # Send or receive failed: the link is gone, wait for the device to reconnect
+            self.cleanup_client()
+
+    async def request(self, message, timeout=None):
+        """Send a message to the Android device and return the full reply, or None on error"""
+        dispatcher = None
+        try:
+            dispatcher = await self.__wait_dispatcher()
+            if message["cmd"] not in READ_ONLY_COMMANDS:
+                self.ui_tree = None  # Click, scroll, back or home: the cached screen is gone
+                self.fingerprint = None
+            with ROBOT_REQUEST_SECONDS.time(device=self.label(), command=command_label(message["cmd"])):
+                return await dispatcher.request(message, timeout=timeout or self.command_timeout)
+        except Exception as e:
+            self.__request_failed(e, dispatcher, message["cmd"])
+            return None
+
+    async def fetch_ui(self, stop_at=None):
+        """
+        Stream the UI of the current screen from the device and parse it while it arrives.
+        With stop_at, stop reading as soon as a node with that text has been seen.
+        Returns (tree, complete): tree is None on error, complete is False when the read stopped early.
+        """
+        dispatcher = None
+        try:
+            dispatcher = await self.__wait_dispatcher()
+            print("Sending command: getFullUI")
+            with ROBOT_REQUEST_SECONDS.time(device=self.label(), command="getFullUI"):
+                reply = await dispatcher.open_stream({"cmd": "getFullUI", "stream": True, "compress": self.compress_ui})
+                parser = None
+                try:
+                    async for chunk in reply.chunks(self.command_timeout):
+                        if parser is None:
+                            parser = UITreeStreamParser(reply.compressed)
+                        nodes = parser.feed(chunk)
+                        if stop_at is not None and any(node.text == stop_at for node in nodes):
+                            print(f"Found {stop_at} after {len(parser.tree)} nodes")
+                            return parser.tree, False
+                finally:
+                    reply.close()
+            if parser is not None:
+                ui_tree = parser.close()
+            else:
+                # Older builds of the service ignore "stream" and answer with one frame
+                ui_tree = UITree.parse((reply.final or {}).get("response") or "")
+            ui_tree.fingerprint = (reply.final or {}).get("fingerprint")
+            print(f"Full UI received: {len(ui_tree)} nodes")
+            return ui_tree, True
+        except Exception as e:
+            self.__request_failed(e, dispatcher, "getFullUI")
+            return None, False
+
+    async def send_command(self, command, timeout=None):
+        """
+        Send command to the Android device and receive response.
+        Commands that change the screen return once the device reports the screen has settled,
+        waiting at most timeout seconds (RPA_SETTLE_TIMEOUT by default) for it to settle.
+        """
+        reply = await self.__send(command, timeout)
+        if reply is None:
+            return None
+        return reply.get("response", "")
+
+    async def __send(self, command, timeout=None, **args):
+        """Send a command with extra arguments, log the response and return the whole reply"""
+        message = {"cmd": command, **args}
+        if command not in READ_ONLY_COMMANDS:
+            timeout = timeout or self.settle_timeout
+            message["settle_ms"] = int(self.settle_time * 1000)
+            message["timeout_ms"] = int(timeout * 1000)
+            timeout += self.command_timeout  # Time for the command itself on top of the settle wait
+
+        print(f"Sending command: {command}")
+        reply = await self.request(message, timeout)
+        if reply is None:
+            return None
+        response = reply.get("response", "")
+        if not response:
+            print("No response received.")
+        if command == "getFullUI":
+            print("Full Response Received:\n")
+        else:
+            print("Response:", response)
+        if reply.get("settled") is False:
+            print(f"Screen did not settle after {command}")
+        return reply
+
+
+    async def run_macro(self, macro, stop_on_failure=True):
+        """
+        Run a list of steps, or the name of a macro in MACROS, on the device in one round trip.
+        Returns the structured reply {"ok": bool, "results": [...]} with one result per step,
+        or None if the device could not be reached.
+        """
+        name = macro if isinstance(macro, str) else "macro"
+        steps = MACROS[macro] if isinstance(macro, str) else macro
+
+        device_steps = []
+        timeout = 0
+        for step in steps:
+            if isinstance(step, str):
+                step = {"cmd": step}
+            step_timeout = step.get("timeout", self.settle_timeout)
+            device_step = {
+                "cmd": step["cmd"],
+                "settle_ms": int(self.settle_time * 1000),
+                "timeout_ms": int(step_timeout * 1000),
+            }
+            timeout += step_timeout
+            if step.get("wait_for"):
+                wait_timeout = step.get("wait_timeout", 10)
+                device_step["wait_for"] = step["wait_for"]
+                device_step["wait_timeout_ms"] = int(wait_timeout * 1000)
+                timeout += wait_timeout
+            device_steps.append(device_step)
+
+        print(f"Running macro: {name} ({len(device_steps)} steps)")
+        reply = await self.request(
+            {"cmd": "macro", "steps": device_steps, "stop_on_failure": stop_on_failure},
+            timeout + self.command_timeout,
+        )
+        if reply is None:
+            return None
+        for result in reply.get("results", []):
+            print(f"  {result.get('cmd')}: {result.get('response')}")
+        if not reply.get("ok"):
+            print(f"Macro {name} failed")
+        return reply
+
+    async def get_ui_tree(self, refresh=False):
+        """Return the parsed UI of the current screen, fetching it only when the cache is stale"""
+        if self.ui_tree is not None and not refresh:
+            return self.ui_tree
+        ui_tree, complete = await self.fetch_ui()
+        if ui_tree is not None:
+            self.__remember_screen(ui_tree)
+        return ui_tree
+
+    async def is_have_ui(self, ui: str, refresh=False) -> bool:
+        """
+        Check if a specific UI element is present on the screen.
+        Use refresh=True when the screen may change on its own, e.g. while the robot travels.
+        """
+        if self.ui_tree is not None and not refresh:
+            return self.ui_tree.has(ui)
+        ui_tree, complete = await self.fetch_ui(stop_at=ui)
+        if ui_tree is None:
+            return False
+        if complete:
+            self.__remember_screen(ui_tree)  # Only a complete screen may answer later checks
+        return ui_tree.has(ui)
+
+    def __remember_screen(self, ui_tree):
+        """Make a complete tree the current screen and keep it for when the screen comes back"""
+        self.ui_tree = ui_tree
+        self.fingerprint = ui_tree.fingerprint
+        if ui_tree.fingerprint is not None:
+            self.screen_cache[ui_tree.fingerprint] = ui_tree
+            self.screen_cache.move_to_end(ui_tree.fingerprint)
+            while len(self.screen_cache) > SCREEN_CACHE_SIZE:
+                self.screen_cache.popitem(last=False)
+
+    async def scroll(self, direction):
+        """
+        Scroll the list with scrollUp or scrollDown and return True if the screen changed.
+        The device answers with the fingerprint of the settled screen, so reaching the end of
+        the list needs no UI fetch, and a screen seen before is served from the cache.
+        """
+        before = self.fingerprint
+        reply = await self.__send(direction, fingerprint=True)
+        if reply is None or "No scrollable" in reply.get("response", ""):
+            ROBOT_SCROLLS.inc(device=self.label(), result="end")
+            return False
+        after = reply.get("fingerprint")
+        if after is None:
+            ROBOT_SCROLLS.inc(device=self.label(), result="moved")
+            return True  # Older builds of the service do not send fingerprints
+        self.fingerprint = after
+        cached = self.screen_cache.get(after)
+        if cached is not None:
+            self.ui_tree = cached
+            self.screen_cache.move_to_end(after)
+        if after == before:
+            print(f"Screen unchanged after {direction}, end of the list")
+            ROBOT_SCROLLS.inc(device=self.label(), result="unchanged")
+            return False
+        ROBOT_SCROLLS.inc(device=self.label(), result="cached" if cached is not None else "moved")
+        return True
+
+    async def query_ui(self, text: str, limit=20):
+        """Ask the device for the nodes with exactly this text, without transferring the hierarchy"""
+        reply = await self.request({"cmd": "queryUI", "text": text, "limit": limit})
+        if reply is None:
+            return []
+        return [UINode.from_dict(node) for node in reply.get("nodes", [])]
+
+    async def exists(self, text: str) -> bool:
+        """Ask the device whether a node with exactly this text is on the screen"""
+        reply = await self.request({"cmd": "exists", "text": text})
+        if reply is None:
+            return False
+        return bool(reply.get("found"))
+
+    async def wait_for_ui(self, predicate, timeout=None, stop_event=None) -> bool:
+        """
+        Wait until the screen matches a predicate, re-checking whenever the device reports a change.
+        predicate is either a text that must be on the screen (checked on the device) or a callable
+        that takes a UITree. Returns False on timeout or when stop_event is set.
+        """
+        if isinstance(predicate, str):
+            text = predicate
+            async def check():
+                return await self.exists(text)
+        else:
+            async def check():
+                ui_tree = await self.get_ui_tree(refresh=True)
+                return ui_tree is not None and predicate(ui_tree)
+
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            # Take the event before checking, so a change during the check is not missed
+            ui_changed = self.ui_changed
+            if await check():
+                return True
+
+            resync_at = loop.time() + self.ui_resync_interval
+            while not ui_changed.is_set() and loop.time() < resync_at:
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                if deadline is not None and loop.time() >= deadline:
+                    return False
+                wait_time = min(STOP_CHECK_INTERVAL, resync_at - loop.time())
+                if deadline is not None:
+                    wait_time = min(wait_time, deadline - loop.time())
+                try:
+                    await asyncio.wait_for(ui_changed.wait(), max(wait_time, 0))
+                except asyncio.TimeoutError:
+                    pass
+
+            if stop_event is not None and stop_event.is_set():
+                return False
+
+    async def search_ui(self, ui: str) -> bool:
+        """Try searching for a UI element by scrolling the screen"""
+        found_ui = False
+
+        if await self.is_have_ui(ui):
+            found_ui = True
+
+        # Try scrolling down
+        scroll_count = 0
+        while scroll_count <= MAX_SCROLLS:
+            if not await self.scroll("scrollDown"):
+                break
+
+            if await self.is_have_ui(ui):
+                found_ui = True
+                break
+            scroll_count += 1
+
+        # Reset scrolling up to top
+        scroll_count = 0
+        while scroll_count <= MAX_SCROLLS:
+            if not await self.scroll("scrollUp"):
+                break
+
+            if await self.is_have_ui(ui):
+                found_ui = True
+            scroll_count += 1
+
+        return found_ui
+
+    async def search_ui_and_click(self, ui: str) -> bool:
+        """
+        Search for a UI element and click it if found.
+        Pages are counted in scrolls from the top of the list. The search jumps straight to the
+        page where the element was last found and falls back to scanning the whole list.
+        """
+        page = 0
+        known_page = self.scroll_index.get(ui)
+        if known_page:
+            while page < known_page:
+                if not await self.scroll("scrollDown"):
+                    break
+                page += 1
+
+        if await self.is_have_ui(ui):
+            return await self.__click_found(ui, page)
+
+        # Try scrolling down
+        scroll_count = 0
+        while scroll_count <= MAX_SCROLLS:
+            if not await self.scroll("scrollDown"):
+                break
+            page += 1
+
+            if await self.is_have_ui(ui):
+                return await self.__click_found(ui, page)
+            scroll_count += 1
+
+        # Reset scrolling up to top, checking the pages above the one we jumped to
+        scroll_count = 0
+        while scroll_count <= MAX_SCROLLS + page:
+            if not await self.scroll("scrollUp"):
+                break
+            page -= 1
+
+            if await self.is_have_ui(ui):
+                return await self.__click_found(ui, page)
+            scroll_count += 1
+
+        return False
+
+    async def search_ui_and_click_all(self, uis):
+        """
+        Click every element of uis in one sweep of the list and return the clicked ones in click order.
+        Each screen is matched against all remaining elements at once, so selecting many points
+        takes one pass over the list instead of one pass per point.
+        """
+        remaining = list(dict.fromkeys(uis))
+        clicked = []
+        page = 0
+        await self.__click_visible(remaining, clicked, page)
+
+        # Sweep down the list
+        scroll_count = 0
+        while remaining and scroll_count <= MAX_SCROLLS:
+            if not await self.scroll("scrollDown"):
+                break
+            page += 1
+            await self.__click_visible(remaining, clicked, page)
+            scroll_count += 1
+
+        # Back up to the top, for elements above the screen the sweep started on
+        scroll_count = 0
+        while remaining and scroll_count <= MAX_SCROLLS + page:
+            if not await self.scroll("scrollUp"):
+                break
+            page -= 1
+            await self.__click_visible(remaining, clicked, page)
+            scroll_count += 1
+
+        if remaining:
+            print(f"Not found: {', '.join(remaining)}")
+        return clicked
+
+    async def __click_visible(self, remaining, clicked, page):
+        """Click every remaining element on the current screen, moving it from remaining to clicked"""
+        ui_tree = await self.get_ui_tree()
+        if ui_tree is None:
+            return
+        for ui in ui_tree.find_all(remaining):
+            await self.__click_found(ui, page)
+            remaining.remove(ui)
+            clicked.append(ui)
+
+    async def __click_found(self, ui, page):
+        """Click an element found on the given page and remember the page for the next search"""
+        await self.send_command(ui)
+        self.scroll_index.update(ui, max(page, 0))
+        return True
@@ -0,0 +1,76 @@
+import datetime
+import socket
+import time
+
+class ConnectionState:
+    """Passive liveness tracking of the link to the Android device"""
+
+    def __init__(self, stale_after):
+        self.stale_after = stale_after  # Seconds without any frame before the link counts as stale
+        self.address = None
+        self.connected = False
+        self.connected_at = None
+        self.last_seen = None  # time.monotonic() of the last frame received
+        self.last_seen_at = None  # Wall-clock time of the same frame, for the API
+        self.last_error = None
+
+    def on_connect(self, address):
+        """A device connected"""
+        self.address = address
+        self.connected = True
+        self.connected_at = datetime.datetime.now()
+        self.last_error = None
+        self.on_activity()
+
+    def on_activity(self):
+        """A frame arrived from the device"""
+        self.last_seen = time.monotonic()
+        self.last_seen_at = datetime.datetime.now()
+
+    def on_failure(self, error):
+        """Sending or receiving failed"""
+        self.last_error = str(error)
+
+    def on_disconnect(self):
+        """The device is gone"""
+        self.connected = False
+
+    def idle_seconds(self):
+        """Seconds since the last frame from the device"""
+        if self.last_seen is None:
+            return None
+        return time.monotonic() - self.last_seen
+
+    def is_healthy(self):
+        """Connected and heard from recently"""
+        return self.connected and self.idle_seconds() < self.stale_after
+
+    def state(self):
+        """One of connected, stale or disconnected"""
+        if not self.connected:
+            return "disconnected"
+        return "connected" if self.is_healthy() else "stale"
+
+    def as_dict(self):
+        """Connection state for the API"""
+        idle = self.idle_seconds()
+        return {
+            "state": self.state(),
+            "address": f"{self.address[0]}:{self.address[1]}" if self.address else None,
+            "connected_at": self.connected_at.strftime('%Y-%m-%d %H:%M:%S') if self.connected_at else None,
+            "last_seen": self.last_seen_at.strftime('%Y-%m-%d %H:%M:%S') if self.last_seen_at else None,
+            "idle_seconds": round(idle, 1) if idle is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+def enable_keepalive(sock, idle=10, interval=5, count=3):
+    """Let the kernel detect a dead peer even when no command is in flight"""
+    if sock is None:
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # Fine-grained timers are Linux only, which is what the Pi runs
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
@@ -1,106 +1,67 @@
-import pymssql
 from dotenv import load_dotenv
 import os
+import time
+
+from .metrics import SQL_CALL_SECONDS, SQL_ERRORS
+from .mssql_storage import MSSQLStorage
+from .sqlite_storage import SQLiteStorage
 
 # Load database configuration from .env file
 load_dotenv()
 
-# Database class for handling SQL Server connections and data insertion
+# Database class for storing measurements and activity logs, on the backend chosen by DB_BACKEND
 class Database:
-    def __init__(self):
-        # Set database configuration from environment variables
-        self.server = os.getenv("DB_SERVER")
-        self.database = os.getenv("DB_DATABASE")
-        self.username = os.getenv("DB_USERNAME")
-        self.password = os.getenv("DB_PASSWORD")
-        
-        self.conn = None
-        self.cursor = None
-        
+    def __init__(self, backend=None):
+        # mssql: SQL Server configured by DB_SERVER etc., sqlite: local file at SQLITE_PATH
+        backend = backend or os.getenv("DB_BACKEND", "mssql")
+        if backend == "mssql":
+            self.storage = MSSQLStorage()
+        elif backend == "sqlite":
+            self.storage = SQLiteStorage()
+        else:
+            raise ValueError(f"Unknown DB_BACKEND {backend}")
+
     def is_database_connected(self):
+        start = time.perf_counter()
         try:
-            # Attempt to connect to the database
-            conn = pymssql.connect(
-                server=self.server, user=self.username, password=self.password, database=self.database
-            )
-            cursor = conn.cursor()
-
-            # Test the connection by executing a simple query
-            cursor.execute('SELECT @@VERSION')
-            version = cursor.fetchone()
-
-            # If no exception occurs and we get a version, the connection is successful
-            print(f"Connected to SQL Server, version: {version[0]}")
-            cursor.close()
-            conn.close()
-            return True
-        except pymssql.Error as e:
-            print(f"Database connection error: {e}")
-            return False
+            return self.storage.is_connected()
         except Exception as e:
-            print(f"Unexpected error: {e}")
+            print(f"Database connection error: {e}")
+            SQL_ERRORS.inc(operation="check")
             return False
+        finally:
+            SQL_CALL_SECONDS.observe(time.perf_counter() - start, operation="check")
 
+    def close(self):
+        # Close the backend's connections, e.g. when the API shuts down
+        self.storage.close()
 
-    def __connect(self):
-        # Establish connection to the SQL Server
-        try:
-            self.conn = pymssql.connect(
-                server=self.server, user=self.username, password=self.password, database=self.database
-            )
-            self.cursor = self.conn.cursor()
-        except pymssql.Error as e:
-            print(f"Database connection error: {e}")
-            
-    def __close(self):
-        # Close database connection
-        if self.cursor:
-            self.cursor.close()
-        if self.conn:
-            self.conn.close()
-            
-    def __save_to_database(self, data, query):
-        # Insert measurement data into the DustMeasurements table
+    def __save_to_database(self, table, data, unique, operation):
+        # Insert rows into a table. Errors are raised to the caller, which spools the rows
+        start = time.perf_counter()
         try:
-            self.__connect()
-
             # Check if data is a list of tuples or a single tuple
             if isinstance(data, list):
-                if all(isinstance(row, tuple) for row in data):  # Multiple rows (list of tuples)
-                    self.cursor.executemany(query, data)
-                else:
-                    print("Each item in data list must be a tuple.")
-                    return
+                if not all(isinstance(row, tuple) for row in data):  # Multiple rows (list of tuples)
+                    raise TypeError("Each item in data list must be a tuple.")
             elif isinstance(data, tuple):  # Single row (single tuple)
-                self.cursor.execute(query, data)
+                data = [data]
             else:
-                print("Data format is not correct.")
-                return
+                raise TypeError("Data format is not correct.")
 
-            self.conn.commit()
+            self.storage.insert(table, data, unique)
             print("Data inserted successfully!")
-        except pymssql.Error as e:
-            print(f"Database error: {e}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
+        except Exception:
+            # Counted here, reported by the caller (the replayer logs it and spools the rows)
+            SQL_ERRORS.inc(operation=operation)
+            raise
         finally:
-            self.__close()
-            
+            SQL_CALL_SECONDS.observe(time.perf_counter() - start, operation=operation)
+
+    def save_measurement(self, data, unique=False):
+        # Insert measurement data into the DustMeasurements table; unique skips rows already stored
+        self.__save_to_database("DustMeasurements", data, unique, "insert_measurement")
 
-    def save_measurement(self, data):
-        # Insert measurement data into the DustMeasurements table
-        query = """
-            INSERT INTO DustMeasurements 
-            (measurement_datetime, room, area, location_name, count, um01, um02, um03, um05, um07, um10, running_state, alarm_high) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-        self.__save_to_database(data, query)
-    
-    def save_activity_log(self, data):
-        # Insert activity log data into the ActivityLogs table
-        query = """
-            INSERT INTO ActivityLogs 
-            (log_timestamp, location_name, activity) 
-            VALUES (%s, %s, %s)
-            """
-        self.__save_to_database(data, query)
+    def save_activity_log(self, data, unique=False):
+        # Insert activity log data into the ActivityLogs table; unique skips rows already stored
+        self.__save_to_database("ActivityLogs", data, unique, "insert_activity")
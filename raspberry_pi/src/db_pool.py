@@ -0,0 +1,93 @@
+import collections
+import contextlib
+import threading
+import time
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of database connections.
+    Connections are reused instead of logging in for every insert. One that sat idle for
+    validate_after seconds is checked before use, one idle for max_idle seconds is closed,
+    and one that raised during use is dropped, so the next checkout reconnects.
+    """
+
+    def __init__(self, connect, validate=None, size=4, max_idle=300.0, validate_after=30.0, timeout=10.0):
+        self.connect = connect  # Opens a new connection
+        self.validate = validate  # validate(connection) raises if the connection is dead
+        self.size = size
+        self.max_idle = max_idle
+        self.validate_after = validate_after
+        self.timeout = timeout  # Seconds to wait for a free connection
+        self.idle = collections.deque()  # (connection, time.monotonic() when returned)
+        self.slots = threading.BoundedSemaphore(size)  # Connections in use at once
+        self.lock = threading.Lock()
+        self.opened = 0  # Connections opened over the pool's life
+        self.closed = False
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrow a connection for the with-block"""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No database connection free after {self.timeout}s")
+        connection = None
+        try:
+            connection = self.__checkout()
+            yield connection
+        except BaseException:
+            self.__discard(connection)
+            connection = None
+            raise
+        finally:
+            if connection is not None:
+                with self.lock:
+                    if self.closed:
+                        self.__discard(connection)
+                    else:
+                        self.idle.append((connection, time.monotonic()))
+            self.slots.release()
+
+    def __checkout(self):
+        while True:
+            with self.lock:
+                if not self.idle:
+                    break
+                # Most recently used first, so surplus connections age out at the far end
+                connection, returned = self.idle.pop()
+                self.__evict_idle()
+            idle_for = time.monotonic() - returned
+            if idle_for > self.max_idle:
+                self.__discard(connection)
+                continue
+            if self.validate is not None and idle_for > self.validate_after:
+                try:
+                    self.validate(connection)
+                except Exception as e:
+                    print(f"Dropping dead database connection: {e}")
+                    self.__discard(connection)
+                    continue
+            return connection
+        connection = self.connect()
+        self.opened += 1
+        return connection
+
+    def __evict_idle(self):
+        # Called with the lock held: close connections that sat unused past max_idle
+        now = time.monotonic()
+        while self.idle and now - self.idle[0][1] > self.max_idle:
+            self.__discard(self.idle.popleft()[0])
+
+    @staticmethod
+    def __discard(connection):
+        if connection is None:
+            return
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        """Close the idle connections; those in use are closed when returned to a closed pool"""
+        with self.lock:
+            self.closed = True
+            while self.idle:
+                self.__discard(self.idle.pop()[0])
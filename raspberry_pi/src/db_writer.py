@@ -0,0 +1,104 @@
+from dotenv import load_dotenv
+import asyncio
+import os
+import time
+
+from .metrics import (DB_WRITER_QUEUE_DEPTH, DB_WRITER_BATCH_ROWS, DB_WRITER_FLUSH_SECONDS,
+                      DB_WRITER_BLOCKED_SECONDS, DB_WRITER_FAILED_ROWS)
+
+# Load configuration from .env file
+load_dotenv()
+
+class DatabaseWriter:
+    """
+    Write-behind queue between the survey and the database.
+    put() only queues a row, so the robot never waits on SQL Server. A background task
+    groups the rows per table and inserts each group with one executemany once
+    DB_WRITER_BATCH rows are waiting or DB_WRITER_INTERVAL seconds have passed.
+    The queue is bounded by DB_WRITER_QUEUE: when it is full, put() waits for room.
+    """
+
+    def __init__(self, writers, on_error=None, max_batch=None, interval=None, max_queue=None):
+        self.writers = writers  # table -> function inserting a list of row tuples, run on a thread
+        self.on_error = on_error  # on_error(table, rows, error) for a batch that failed
+        self.max_batch = int(max_batch or os.getenv("DB_WRITER_BATCH", 100))
+        self.interval = float(interval or os.getenv("DB_WRITER_INTERVAL", 1.0))
+        self.queue = asyncio.Queue(int(max_queue or os.getenv("DB_WRITER_QUEUE", 10000)))
+        self.ready = asyncio.Event()  # Set when a full batch is waiting, or on close
+        self.task = None
+        self.closing = False
+
+    def start(self):
+        """Start the flush task on the running loop"""
+        if self.task is None or self.task.done():
+            self.closing = False
+            self.task = asyncio.create_task(self.__run())
+        return self.task
+
+    async def put(self, table, row):
+        """Queue a row for a table; returns at once unless the queue is full"""
+        if table not in self.writers:
+            raise ValueError(f"No writer for table {table}")
+        if self.closing:
+            raise RuntimeError("Database writer is closed")
+        if self.queue.full():
+            start = time.perf_counter()
+            await self.queue.put((table, row))
+            DB_WRITER_BLOCKED_SECONDS.observe(time.perf_counter() - start)
+        else:
+            self.queue.put_nowait((table, row))
+        DB_WRITER_QUEUE_DEPTH.inc(table=table)
+        if self.queue.qsize() >= self.max_batch - 1:
+            self.ready.set()
+
+    async def flush(self):
+        """Wait until every row queued so far has been written"""
+        await self.queue.join()
+
+    async def close(self):
+        """Write everything still queued, then stop the flush task"""
+        self.closing = True
+        self.ready.set()
+        if self.task is not None and not self.task.done():
+            await self.queue.join()
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def __run(self):
+        while True:
+            batch = [await self.queue.get()]
+            # Give more rows until the interval is over to join, unless a full batch is waiting
+            if self.queue.qsize() < self.max_batch - 1 and not self.closing:
+                self.ready.clear()
+                try:
+                    await asyncio.wait_for(self.ready.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self.__write(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def __write(self, batch):
+        tables = {}
+        for table, row in batch:
+            tables.setdefault(table, []).append(row)
+        for table, rows in tables.items():
+            DB_WRITER_QUEUE_DEPTH.dec(len(rows), table=table)
+            DB_WRITER_BATCH_ROWS.observe(len(rows), table=table)
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.writers[table], rows)
+            except Exception as e:
+                DB_WRITER_FAILED_ROWS.inc(len(rows), table=table)
+                print(f"Database writer: {len(rows)} rows for {table} failed: {e}")
+                if self.on_error is not None:
+                    self.on_error(table, rows, e)
+            finally:
+                DB_WRITER_FLUSH_SECONDS.observe(time.perf_counter() - start, table=table)
@@ -0,0 +1,94 @@
+import asyncio
+from dotenv import load_dotenv
+import os
+
+from .async_robot import AsyncRobot
+from .protocol import ProtocolError, decode_body, read_frame
+from .scroll_index import ScrollIndex
+
+# Load configuration from .env file
+load_dotenv()
+
+class RobotFleet:
+    """TCP server for many Android devices, each driven by its own AsyncRobot"""
+
+    def __init__(self):
+        self.server_bind = os.getenv("RPA_BIND", "0.0.0.0")
+        self.server_port = int(os.getenv("RPA_PORT", 12345))
+        self.handshake_timeout = float(os.getenv("FLEET_HANDSHAKE_TIMEOUT", 5))
+        self.server = None
+        self.robots = {}  # device_id -> AsyncRobot, kept across reconnects
+        self.scroll_index = ScrollIndex()  # The point list is the same app on every device
+
+    async def start_server(self):
+        """Start the TCP server on the running event loop"""
+        self.server = await asyncio.start_server(self.__handle_client, self.server_bind, self.server_port)
+        print(f"Fleet server listening on {self.server_bind}:{self.server_port}")
+
+    async def stop_server(self):
+        """Drop every device and close the TCP server"""
+        for robot in self.robots.values():
+            await robot.stop_server()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def __handshake(self, reader, writer):
+        """Read the device id the device sends right after connecting"""
+        try:
+            flags, request_id, body = await asyncio.wait_for(read_frame(reader), self.handshake_timeout)
+            message = decode_body(body)
+            if request_id == 0 and message.get("event") == "hello" and message.get("device_id"):
+                return str(message["device_id"])
+            print(f"Unexpected first frame from device: {message}")
+        except asyncio.TimeoutError:
+            print("Device did not send a hello, identifying it by address")
+        # Older builds of the service do not send a hello: the address is the best id we have
+        return writer.get_extra_info("peername")[0]
+
+    async def __handle_client(self, reader, writer):
+        try:
+            device_id = await self.__handshake(reader, writer)
+        except (asyncio.IncompleteReadError, OSError, ProtocolError) as e:
+            print(f"Handshake failed: {e}")
+            writer.close()
+            return
+
+        robot = self.robots.get(device_id)
+        if robot is None:
+            robot = AsyncRobot(device_id=device_id, scroll_index=self.scroll_index)
+            self.robots[device_id] = robot
+        print(f"Device {device_id} registered")
+        robot.start_heartbeat()
+        await robot.attach(reader, writer)
+
+    def get(self, device_id):
+        """Return the robot registered under a device id, or None"""
+        return self.robots.get(device_id)
+
+    def connected_robots(self):
+        """Robots whose link is currently healthy"""
+        return [robot for robot in self.robots.values() if robot.connection.is_healthy()]
+
+    def primary(self):
+        """First connected robot, for tasks that need a single robot"""
+        robots = self.connected_robots()
+        return robots[0] if robots else None
+
+    def state(self):
+        """Connection state of every registered device"""
+        return {device_id: robot.connection_state() for device_id, robot in self.robots.items()}
+
+    async def dispatch(self, worker, robots=None):
+        """
+        Run worker(robot) concurrently on every connected robot, each under its robot's lock.
+        Workers share their job queue themselves, e.g. by popping from the same list.
+        Returns the results in robot order; a worker that raised returns its exception.
+        """
+        robots = self.connected_robots() if robots is None else robots
+
+        async def run(robot):
+            async with robot.locked():
+                return await worker(robot)
+
+        return await asyncio.gather(*(run(robot) for robot in robots), return_exceptions=True)
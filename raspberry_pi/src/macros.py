@@ -0,0 +1,18 @@
+# Named command sequences that run on the device in one round trip, see AsyncRobot.run_macro.
+# A step is either a command string or a dict with:
+#   cmd          - the command, same as for send_command
+#   wait_for     - optional text that must be on the screen before the next step
+#   wait_timeout - seconds to wait for wait_for (default 10)
+#   timeout      - seconds the step may take to settle (default RPA_SETTLE_TIMEOUT)
+MACROS = {
+    # Home screen -> Keenon delivery app
+    "open_delivery": [
+        "goHome",
+        "Peanut Food Delivery",
+    ],
+    # Back to the menu (top-left button) -> point list of the Direct mode
+    "open_direct": [
+        "clickBackButton",
+        "Direct",
+    ],
+}
@@ -0,0 +1,232 @@
+from pymodbus.exceptions import ModbusException
+
+from dotenv import load_dotenv
+import asyncio
+import inspect
+import math
+import os
+
+from .modbus_session import AsyncModbusSession
+from .registers import RECORD_COUNT_ADDRESS, RECORD_SIZE
+from .sensor import read_records, record_from_registers
+
+# Load sensor configuration from .env file
+load_dotenv()
+
+# Count channels of a record; scaled up when a sample is cut short
+COUNT_CHANNELS = ('um01', 'um02', 'um03', 'um05', 'um07', 'um10')
+
+class EarlyStopRule:
+    """
+    Decide a measurement before the sample period is over, from the live um03 count.
+    NG as soon as the count is above the limit: counts only grow during a sample.
+    OK once the count projected to the full period stays below the limit even at the
+    upper Poisson bound (normal approximation, z standard deviations).
+    EARLY_STOP selects the rule: off (default), ng (NG only) or both. Keep it off until the
+    live counts at LIVE_DATA_ADDRESS are confirmed on the SOLAIR: 30001 holds the record
+    selected through 40025, not the sample in progress.
+    """
+
+    def __init__(self, limit, mode=None, z=None, min_time=None, channel="um03"):
+        self.limit = limit
+        self.mode = mode or os.getenv("EARLY_STOP", "off")
+        self.z = float(z if z is not None else os.getenv("EARLY_STOP_Z", 3))
+        self.min_time = float(min_time if min_time is not None else os.getenv("EARLY_STOP_MIN_TIME", 20))
+        self.channel = channel
+
+    def decide(self, record, elapsed, total):
+        """Return "NG", "OK" or None while the result is still open"""
+        if self.mode == "off" or elapsed <= 0:
+            return None
+        count = record[self.channel]
+        if count > self.limit:
+            return "NG"
+        if self.mode == "both" and elapsed >= self.min_time:
+            upper = count + self.z * math.sqrt(count) + self.z ** 2  # Upper bound of the count so far
+            if upper * total / elapsed < self.limit:
+                return "OK"
+        return None
+
+
+class MeasurementEngine:
+    """
+    Asyncio measurement on a SOLAIR 1100LD: start, wait, stop and read run as one task on the
+    event loop. Cancelling the task, or calling stop(), writes the stop register right away
+    instead of racing a sleeping worker thread.
+    """
+
+    def __init__(self, ip=None, slave=None, port=None):
+        self.ip = ip or os.getenv("SOLAIR_IP")
+        self.port = int(port or os.getenv("SOLAIR_PORT", 502))
+        self.slave = int(slave if slave is not None else os.getenv("SLAVE"))
+        self.sensor_id = f"{self.ip}:{self.slave}"  # Stored with each record
+        self.session = AsyncModbusSession.for_host(self.ip, self.port)
+        self.measurement_time = int(os.getenv("MEASUREMENT_TIME", 70))  # Default 70 seconds
+        self.progress_interval = float(os.getenv("MEASUREMENT_PROGRESS_INTERVAL", 5))
+        self.sample_interval = float(os.getenv("SAMPLE_INTERVAL", 2))  # Live reads while sampling
+        # Input registers holding the counts of the sample in progress, same layout as a record
+        self.live_address = int(os.getenv("LIVE_DATA_ADDRESS", 30001)) - 30001
+        self.samples = []  # (elapsed seconds, live record) of the current measurement
+        self.decision = None  # "NG" or "OK" when the last measurement stopped early
+        self.decided_after = None  # Seconds into the sample of that decision
+        # Scale the counts of an early-stopped record to the full period; off, they are stored as read
+        self.scale = os.getenv("EARLY_STOP_SCALE", "false").lower() == "true"
+        self.task = None  # The running measurement
+        self.stopped = False  # Set by stop(), so measure() can tell it from an outside cancel
+        self.is_measuring = False
+
+    async def is_sensor_connected(self):
+        """Check that the SOLAIR answers, over the shared session"""
+        try:
+            response = await self.session.call("read_holding_registers", address=RECORD_COUNT_ADDRESS, count=1, slave=self.slave)
+            return not response.isError()
+        except ModbusException as e:
+            print(f"Failed to connect to SOLAIR 1100LD: {e}")
+            return False
+
+    def start(self, progress=None, rule=None, on_sample=None):
+        """
+        Start a measurement task and return it. progress(elapsed, total), plain or async,
+        is called every MEASUREMENT_PROGRESS_INTERVAL seconds while the SOLAIR samples.
+        With rule (an EarlyStopRule) or on_sample(elapsed, record), the live counts are read
+        every SAMPLE_INTERVAL seconds and the sample ends as soon as the rule decides.
+        """
+        if self.task is not None and not self.task.done():
+            raise RuntimeError(f"SOLAIR {self.ip} is already measuring")
+        self.stopped = False
+        self.task = asyncio.create_task(self.__acquire(progress, rule, on_sample))
+        return self.task
+
+    async def measure(self, progress=None, rule=None, on_sample=None):
+        """Run one measurement and return its record, or None if it failed or was stopped"""
+        task = self.start(progress, rule, on_sample)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task.cancelled() and self.stopped:
+                print("Measurement cancelled.")
+                return None
+            raise
+
+    def stop(self):
+        """Cancel the running measurement; its task writes the stop register before it ends"""
+        if self.task is not None and not self.task.done():
+            self.stopped = True
+            self.task.cancel()
+
+    async def __acquire(self, progress, rule, on_sample):
+        self.samples = []
+        self.decision = None
+        self.decided_after = None
+        sampling = (rule is not None and rule.mode != "off") or on_sample is not None
+        if sampling:
+            # Live reads must be newer than what the live block held before the start, e.g. the
+            # last record loaded through 40025; compared on the sensor clock
+            before = await self.read_live()
+            if before is None:
+                print("No live read before the start, sampling without live counts")
+                sampling = False
+        try:
+            await self.session.call("write_register", 1, 11, slave=self.slave)  # Start measurement command
+        except ModbusException as e:
+            print(f"Modbus IO Error during measurement: {e}")
+            return None
+        self.is_measuring = True
+        print("Measurement started.")
+        total = self.measurement_time
+        elapsed = 0
+        try:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            next_progress = self.progress_interval
+            next_sample = self.sample_interval if sampling else math.inf
+            stale = False  # A stale live read was seen, printed once
+            while elapsed < total:
+                await asyncio.sleep(max(min(next_progress, next_sample, total) - elapsed, 0))
+                elapsed = min(loop.time() - started, total)
+                if sampling and elapsed >= next_sample and elapsed < total:
+                    next_sample += self.sample_interval
+                    record = await self.read_live()
+                    if record is not None and record['record_timestamp'] <= before['record_timestamp']:
+                        if not stale:
+                            print("Live read is not newer than the start, ignored")
+                        stale = True
+                        record = None
+                    if record is not None:
+                        self.samples.append((elapsed, record))
+                        await self.__notify(on_sample, elapsed, record)
+                        if rule is not None:
+                            self.decision = rule.decide(record, elapsed, total)
+                            if self.decision is not None:
+                                self.decided_after = elapsed
+                                print(f"Result {self.decision} after {elapsed:.0f}/{total}s, stopping early")
+                                break
+                if elapsed >= next_progress:
+                    next_progress += self.progress_interval
+                    await self.__notify(progress, elapsed, total)
+        finally:
+            # Runs on cancel too: the SOLAIR must never be left sampling
+            await self.__write_stop()
+        data = await self.read_data()
+        if self.scale and data is not None and self.decision is not None and 0 < data['sample_time'] < total:
+            # Opt-in: project the shorter sample the record covers to the full period
+            for channel in COUNT_CHANNELS:
+                data[channel] = round(data[channel] * total / data['sample_time'])
+        return data
+
+    @staticmethod
+    async def __notify(callback, *args):
+        if callback is None:
+            return
+        result = callback(*args)
+        if inspect.isawaitable(result):
+            await result
+
+    async def read_live(self):
+        """Read the counts of the sample in progress"""
+        try:
+            response = await self.session.call("read_input_registers", self.live_address, count=RECORD_SIZE, slave=self.slave)
+            if response.isError():
+                return None
+            return record_from_registers(response.registers, self.sensor_id)
+        except ModbusException as e:
+            print(f"Modbus IO Error during live read: {e}")
+            return None
+
+    async def __write_stop(self):
+        try:
+            await self.session.call("write_register", 1, 12, slave=self.slave)  # Stop measurement command
+            print("Measurement stopped.")
+        except ModbusException as e:
+            print(f"Modbus IO Error during stop measurement: {e}")
+        finally:
+            self.is_measuring = False
+
+    async def read_data(self):
+        """Read the latest record from the SOLAIR"""
+        # Point the record index (40025) at the newest record, then read it from 30001
+        records = await self.__run(read_records(self.slave, self.sensor_id, limit=1, stored=False))
+        return records[-1] if records else None
+
+    async def backfill(self, since=None, limit=None):
+        """
+        Read back the records stored on the SOLAIR, oldest first, like Sensor.backfill.
+        Refused while measuring: loading a record moves the index the measurement reads from.
+        """
+        if self.task is not None and not self.task.done():
+            raise RuntimeError(f"SOLAIR {self.ip} is measuring")
+        return await self.__run(read_records(self.slave, self.sensor_id, since, limit))
+
+    async def __run(self, steps):
+        # Run the Modbus calls of a generator like read_records on the session
+        try:
+            operation, args, kwargs = next(steps)
+            while True:
+                try:
+                    response = await self.session.call(operation, *args, **kwargs)
+                except ModbusException as e:
+                    operation, args, kwargs = steps.throw(e)
+                else:
+                    operation, args, kwargs = steps.send(response)
+        except StopIteration as done:
+            return done.value
@@ -0,0 +1,211 @@
+import bisect
+import contextlib
+import threading
+import time
+
+# Upper bounds in seconds, from a fast command round trip to a full dust measurement
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Commands of MyAccessibilityService; anything else is the text of a node to click
+DEVICE_COMMANDS = {
+    "ping", "getFullUI", "exists", "queryUI", "macro", "goHome", "goBack", "showRecents",
+    "scrollUp", "scrollDown", "clickBackButton",
+}
+
+def command_label(command):
+    """Label for a command, so clicks on every point share one series"""
+    return command if command in DEVICE_COMMANDS else "click"
+
+
+def escape(value):
+    """Escape a label value for the text format"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric:
+    """Base of the in-memory metrics; values are kept per label set"""
+    kind = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()  # Sensor and Database run on worker threads
+
+    def key(self, labels):
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def label_text(self, key, extra=()):
+        pairs = list(zip(self.labels, key)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.extend(self.render_value(key, value))
+        return lines
+
+
+class Counter(Metric):
+    """Monotonic count, e.g. bytes sent or failed requests"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self.key(labels), 0)
+
+    def render_value(self, key, value):
+        return [f"{self.name}{self.label_text(key)} {value}"]
+
+
+class Gauge(Metric):
+    """Value that goes up and down, e.g. the depth of a queue"""
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        return self.values.get(self.key(labels), 0)
+
+    def render_value(self, key, value):
+        return [f"{self.name}{self.label_text(key)} {value}"]
+
+
+class Histogram(Metric):
+    """Distribution of durations in fixed buckets, cheap enough to observe every command"""
+    kind = "histogram"
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe how long the with-block took"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render_value(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            lines.append(f"{self.name}_bucket{self.label_text(key, [('le', le)])} {cumulative}")
+        lines.append(f"{self.name}_sum{self.label_text(key)} {total}")
+        lines.append(f"{self.name}_count{self.label_text(key)} {count}")
+        return lines
+
+
+class Registry:
+    """All metrics of the process, rendered together for /metrics"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        # Modules may be imported twice under different names; keep the first metric
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, description, labels=()):
+        return self.register(Counter(name, description, labels))
+
+    def gauge(self, name, description, labels=()):
+        return self.register(Gauge(name, description, labels))
+
+    def histogram(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, description, labels, buckets))
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Robot link
+ROBOT_REQUEST_SECONDS = REGISTRY.histogram(
+    "robot_request_seconds", "Round trip of a command to the Android device, settle wait included",
+    ("device", "command"))
+ROBOT_REQUEST_FAILURES = REGISTRY.counter(
+    "robot_request_failures_total", "Commands that got no reply", ("device", "command", "reason"))
+ROBOT_BYTES_SENT = REGISTRY.counter(
+    "robot_bytes_sent_total", "Frame bytes sent to Android devices", ("command",))
+ROBOT_BYTES_RECEIVED = REGISTRY.counter(
+    "robot_bytes_received_total", "Frame bytes received from Android devices", ("command",))
+ROBOT_SCROLLS = REGISTRY.counter(
+    "robot_scrolls_total", "Scrolls while searching lists", ("device", "result"))
+ROBOT_LOCK_WAIT_SECONDS = REGISTRY.histogram(
+    "robot_lock_wait_seconds", "Time a task waited for a robot's lock", ("device",))
+
+# Sensor and database
+MODBUS_CALL_SECONDS = REGISTRY.histogram(
+    "modbus_call_seconds", "Modbus TCP call latency", ("sensor", "operation"))
+MODBUS_ERRORS = REGISTRY.counter(
+    "modbus_errors_total", "Failed Modbus TCP calls", ("sensor", "operation"))
+SQL_CALL_SECONDS = REGISTRY.histogram(
+    "sql_call_seconds", "Database call latency", ("operation",))
+SQL_ERRORS = REGISTRY.counter(
+    "sql_errors_total", "Failed database calls", ("operation",))
+DB_WRITER_QUEUE_DEPTH = REGISTRY.gauge(
+    "db_writer_queue_depth", "Rows waiting in the write-behind queue", ("table",))
+DB_WRITER_BATCH_ROWS = REGISTRY.histogram(
+    "db_writer_batch_rows", "Rows per batch insert", ("table",), buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+DB_WRITER_FLUSH_SECONDS = REGISTRY.histogram(
+    "db_writer_flush_seconds", "Time to insert one batch", ("table",))
+DB_WRITER_BLOCKED_SECONDS = REGISTRY.histogram(
+    "db_writer_blocked_seconds", "Time a writer waited because the queue was full")
+DB_WRITER_FAILED_ROWS = REGISTRY.counter(
+    "db_writer_failed_rows_total", "Rows of batches that could not be inserted", ("table",))
+SPOOL_DEPTH = REGISTRY.gauge(
+    "spool_depth", "Rows waiting in the on-disk spool for the database", ("table",))
+SPOOL_LAG_SECONDS = REGISTRY.gauge(
+    "spool_lag_seconds", "Age of the oldest spooled row")
+SPOOL_SPOOLED_ROWS = REGISTRY.counter(
+    "spool_spooled_rows_total", "Rows written to the spool because the database failed or was behind", ("table",))
+SPOOL_REPLAYED_ROWS = REGISTRY.counter(
+    "spool_replayed_rows_total", "Spooled rows inserted into the database", ("table",))
+
+# Survey
+SURVEY_PHASE_SECONDS = REGISTRY.histogram(
+    "survey_phase_seconds", "Time spent per point in each phase of a survey", ("device", "phase"))
+MEASUREMENT_RETRIES = REGISTRY.counter(
+    "dust_measurement_retries_total", "Measurements repeated because the result was NG or failed")
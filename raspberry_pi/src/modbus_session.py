@@ -0,0 +1,213 @@
+from pymodbus.client import AsyncModbusTcpClient, ModbusTcpClient
+from pymodbus.exceptions import ConnectionException, ModbusIOException
+
+from dotenv import load_dotenv
+import asyncio
+import os
+import threading
+import time
+
+from .metrics import MODBUS_CALL_SECONDS, MODBUS_ERRORS
+
+# Load configuration from .env file
+load_dotenv()
+
+class SessionState:
+    """
+    Reconnect backoff and call outcomes of one Modbus session, shared by ModbusSession and
+    AsyncModbusSession so both follow the same rules: after a failed connect no new attempt
+    until the backoff has passed, doubling up to MODBUS_RECONNECT_MAX; a call that fails on
+    the connection is retried once on a fresh one.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.backoff_min = float(os.getenv("MODBUS_RECONNECT_MIN", 0.5))
+        self.backoff_max = float(os.getenv("MODBUS_RECONNECT_MAX", 30))
+        self.backoff = self.backoff_min
+        self.next_attempt = 0.0  # time.monotonic() before which no reconnect is tried
+        self.last_error = None
+        self.last_ok = None  # time.monotonic() of the last successful call
+
+    def may_connect(self):
+        """False while still backing off after the last failed connect"""
+        return time.monotonic() >= self.next_attempt
+
+    def on_connect(self, connected):
+        """A connect attempt ended; returns connected"""
+        if connected:
+            print(f"Modbus session to {self.host}:{self.port} open")
+            self.backoff = self.backoff_min
+            self.next_attempt = 0.0
+            return True
+        MODBUS_ERRORS.inc(sensor=self.host, operation="connect")
+        self.last_error = "Connect failed"
+        self.next_attempt = time.monotonic() + self.backoff
+        print(f"Modbus connect to {self.host}:{self.port} failed, next try in {self.backoff:.1f}s")
+        self.backoff = min(self.backoff * 2, self.backoff_max)
+        return False
+
+    def on_call_error(self, operation, error, attempt):
+        """A call failed on the connection; True when it should be retried on a new one"""
+        MODBUS_ERRORS.inc(sensor=self.host, operation=operation)
+        self.last_error = str(error) or type(error).__name__
+        if attempt == 0:
+            print(f"Modbus {operation} failed ({self.last_error}), reconnecting")
+            return True
+        return False
+
+    def on_response(self, operation, response):
+        """A call was answered; returns the response"""
+        if response.isError():
+            MODBUS_ERRORS.inc(sensor=self.host, operation=operation)
+        else:
+            self.last_ok = time.monotonic()
+            self.last_error = None
+        return response
+
+    def unreachable(self):
+        return ConnectionException(f"{self.host}:{self.port} unreachable ({self.last_error})")
+
+
+class ModbusSession:
+    """
+    Long-lived Modbus TCP connection to one SOLAIR, shared by every sensor operation.
+    The SOLAIR accepts only a few TCP clients, so the connection is opened once and kept;
+    after a failure it is reopened with exponential backoff instead of on every call.
+    """
+
+    sessions = {}  # (host, port) -> ModbusSession, so sensors behind one gateway share it
+    sessions_lock = threading.Lock()
+
+    def __init__(self, host, port=502):
+        self.host = host
+        self.port = port
+        self.timeout = float(os.getenv("MODBUS_TIMEOUT", 3))
+        # pymodbus retries and reconnects on its own too; keep that to a single quick attempt
+        self.client = ModbusTcpClient(host, port=port, timeout=self.timeout, retries=1)
+        self.lock = threading.RLock()  # One request at a time on the connection
+        self.state = SessionState(host, port)
+
+    @classmethod
+    def for_host(cls, host, port=502):
+        """Return the shared session for a host, creating it on first use"""
+        with cls.sessions_lock:
+            session = cls.sessions.get((host, port))
+            if session is None:
+                session = cls.sessions[(host, port)] = cls(host, port)
+            return session
+
+    def connect(self):
+        """Make sure the connection is open; returns False while the device is unreachable"""
+        with self.lock:
+            if self.client.is_socket_open():
+                return True
+            if not self.state.may_connect():
+                return False
+            with MODBUS_CALL_SECONDS.time(sensor=self.host, operation="connect"):
+                connected = self.client.connect()
+            return self.state.on_connect(connected)
+
+    def call(self, operation, *args, **kwargs):
+        """
+        Run a client method, e.g. call("read_input_registers", 0, count=100, slave=1).
+        A broken connection is reopened and the call retried once. Returns the pymodbus
+        response; raises ConnectionException when the device cannot be reached.
+        """
+        with self.lock:
+            for attempt in range(2):
+                if not self.connect():
+                    raise self.state.unreachable()
+                try:
+                    with MODBUS_CALL_SECONDS.time(sensor=self.host, operation=operation):
+                        response = getattr(self.client, operation)(*args, **kwargs)
+                except (ConnectionException, ModbusIOException, OSError) as e:
+                    self.client.close()  # Start over with a fresh socket
+                    if self.state.on_call_error(operation, e, attempt):
+                        continue
+                    raise
+                return self.state.on_response(operation, response)
+
+    def is_healthy(self):
+        """Open and the last call on it succeeded"""
+        return self.client.is_socket_open() and self.state.last_error is None
+
+    def close(self):
+        """Close the connection; the next call reopens it"""
+        with self.lock:
+            self.client.close()
+
+    @classmethod
+    def close_all(cls):
+        """Close every shared session, e.g. when the API shuts down"""
+        with cls.sessions_lock:
+            for session in cls.sessions.values():
+                session.close()
+
+
+class AsyncModbusSession:
+    """
+    Asyncio counterpart of ModbusSession for code running on the API's event loop.
+    Same sharing per host, retry-once and backoff rules; the client is created on first use
+    because pymodbus binds it to the running loop.
+    """
+
+    sessions = {}  # (host, port) -> AsyncModbusSession
+
+    def __init__(self, host, port=502):
+        self.host = host
+        self.port = port
+        self.timeout = float(os.getenv("MODBUS_TIMEOUT", 3))
+        self.client = None
+        self.lock = asyncio.Lock()  # One request at a time on the connection
+        self.state = SessionState(host, port)
+
+    @classmethod
+    def for_host(cls, host, port=502):
+        """Return the shared session for a host, creating it on first use"""
+        session = cls.sessions.get((host, port))
+        if session is None:
+            session = cls.sessions[(host, port)] = cls(host, port)
+        return session
+
+    async def connect(self):
+        """Make sure the connection is open; returns False while the device is unreachable"""
+        if self.client is not None and self.client.connected:
+            return True
+        if not self.state.may_connect():
+            return False
+        if self.client is None:
+            # reconnect_delay=0: reconnecting is this class's job, with its own backoff
+            self.client = AsyncModbusTcpClient(
+                self.host, port=self.port, timeout=self.timeout, retries=1, reconnect_delay=0)
+        with MODBUS_CALL_SECONDS.time(sensor=self.host, operation="connect"):
+            connected = await self.client.connect()
+        return self.state.on_connect(connected)
+
+    async def call(self, operation, *args, **kwargs):
+        """Run a client method like ModbusSession.call, without blocking the event loop"""
+        async with self.lock:
+            for attempt in range(2):
+                if not await self.connect():
+                    raise self.state.unreachable()
+                try:
+                    with MODBUS_CALL_SECONDS.time(sensor=self.host, operation=operation):
+                        response = await getattr(self.client, operation)(*args, **kwargs)
+                except (ConnectionException, ModbusIOException, OSError, asyncio.TimeoutError) as e:
+                    self.client.close()
+                    if self.state.on_call_error(operation, e, attempt):
+                        continue
+                    raise
+                return self.state.on_response(operation, response)
+
+    def close(self):
+        """Close the connection; the next call reopens it"""
+        if self.client is not None:
+            self.client.close()
+
+    @classmethod
+    def close_all(cls):
+        """Close every shared session"""
+        for session in cls.sessions.values():
+            session.close()
@@ -0,0 +1,138 @@
+import pymssql
+from dotenv import load_dotenv
+import os
+import threading
+
+from .db_pool import ConnectionPool
+from .metrics import SQL_CALL_SECONDS, SQL_ERRORS
+from .storage import Storage, COLUMNS, NATURAL_KEYS
+
+# Load database configuration from .env file
+load_dotenv()
+
+# DustMeasurements columns added after the table was first created, with their SQL Server types
+ADDED_COLUMNS = {"sensor": "NVARCHAR(64) NULL", "record_timestamp": "BIGINT NULL"}
+# Backs the natural key lookup of every replayed measurement
+KEY_INDEX = "DustMeasurements_record_key"
+
+def insert_query(table, unique=False):
+    # INSERT for one row of a table; with unique, only when no row has the same natural key
+    columns = ", ".join(COLUMNS[table])
+    values = ", ".join(["%s"] * len(COLUMNS[table]))
+    if not unique:
+        return f"INSERT INTO {table} ({columns}) VALUES ({values})"
+    # NULL-safe comparison: rows saved before the sensor column have none
+    match = " AND ".join(f"({column} = %s OR ({column} IS NULL AND %s IS NULL))" for column in NATURAL_KEYS[table])
+    return f"INSERT INTO {table} ({columns}) SELECT {values} WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {match})"
+
+def unique_params(table, row):
+    # Row values followed by each natural key value twice, for insert_query(table, unique=True)
+    params = list(row)
+    for column in NATURAL_KEYS[table]:
+        value = row[COLUMNS[table].index(column)]
+        params += [value, value]
+    return tuple(params)
+
+# SQL Server backend, configured with the DB_* variables
+class MSSQLStorage(Storage):
+    name = "mssql"
+
+    def __init__(self):
+        # Set database configuration from environment variables
+        self.server = os.getenv("DB_SERVER")
+        self.database = os.getenv("DB_DATABASE")
+        self.username = os.getenv("DB_USERNAME")
+        self.password = os.getenv("DB_PASSWORD")
+        self.schema_checked = False  # Set once the first connection brought the schema up to date
+        self.schema_lock = threading.Lock()
+
+        # Logins are reused across inserts instead of one TDS login per row
+        self.pool = ConnectionPool(
+            self.__connect, self.__validate,
+            size=int(os.getenv("DB_POOL_SIZE", 4)),
+            max_idle=float(os.getenv("DB_POOL_MAX_IDLE", 300)),  # Seconds before an unused connection is closed
+            validate_after=float(os.getenv("DB_POOL_VALIDATE_AFTER", 30)),  # Idle seconds before a ping on checkout
+        )
+
+    def is_connected(self):
+        # Test a pooled connection by executing a simple query
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT @@VERSION')
+            version = cursor.fetchone()
+            cursor.close()
+
+        # If no exception occurs and we get a version, the connection is successful
+        print(f"Connected to SQL Server, version: {version[0]}")
+        return True
+
+    def __connect(self):
+        # Establish a new connection to the SQL Server, for the pool
+        try:
+            with SQL_CALL_SECONDS.time(operation="connect"):
+                conn = pymssql.connect(
+                    server=self.server, user=self.username, password=self.password, database=self.database
+                )
+        except pymssql.Error as e:
+            print(f"Database connection error: {e}")
+            SQL_ERRORS.inc(operation="connect")
+            raise
+        try:
+            self.__check_schema(conn)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def __check_schema(self, conn):
+        # Add the natural key columns and their index on a server set up before them. Until that
+        # succeeds no connection is handed out, so the connection check fails and no survey starts.
+        with self.schema_lock:
+            if self.schema_checked:
+                return
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = %s",
+                               ("DustMeasurements",))
+                columns = {row[0].lower() for row in cursor.fetchall()}
+                if not columns:
+                    raise RuntimeError("Table DustMeasurements not found")
+                for column, type in ADDED_COLUMNS.items():
+                    if column.lower() not in columns:
+                        print(f"Adding column {column} to DustMeasurements")
+                        cursor.execute(f"ALTER TABLE DustMeasurements ADD {column} {type}")
+                keys = ", ".join(NATURAL_KEYS["DustMeasurements"])
+                cursor.execute(
+                    "IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = %s AND object_id = OBJECT_ID('DustMeasurements')) "
+                    f"CREATE INDEX {KEY_INDEX} ON DustMeasurements ({keys})", (KEY_INDEX,))
+                conn.commit()
+            except (pymssql.Error, RuntimeError) as e:
+                print(f"Database schema error: {e}")
+                SQL_ERRORS.inc(operation="schema")
+                raise
+            finally:
+                cursor.close()
+            self.schema_checked = True
+
+    @staticmethod
+    def __validate(conn):
+        # Raises if an idle pooled connection was dropped by the server or the network
+        cursor = conn.cursor()
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+        cursor.close()
+
+    def insert(self, table, rows, unique=False):
+        query = insert_query(table, unique)
+        if unique:
+            rows = [unique_params(table, row) for row in rows]
+        # A connection that fails here is dropped by the pool, the next insert reconnects
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(query, rows)
+            conn.commit()
+            cursor.close()
+
+    def close(self):
+        # Close the pooled connections, e.g. when the API shuts down
+        self.pool.close()
@@ -0,0 +1,183 @@
+import asyncio
+import itertools
+import json
+import struct
+
+from .metrics import ROBOT_BYTES_RECEIVED, ROBOT_BYTES_SENT, command_label
+
+# Every message on the robot socket is a frame:
+#   flags (1 byte) | request id (4 bytes) | body length (4 bytes) | body
+# All integers are big-endian. The body is a UTF-8 JSON object. Replies carry
+# the request id of the command they answer, so several commands can be in
+# flight on one socket and each reply is matched to the right caller. Frames
+# with request id 0 are events the device pushes on its own: "hello" with its
+# device id right after connecting, and "uiChanged".
+#
+# A streamed reply is any number of FLAG_STREAM frames whose bodies are raw
+# bytes (a zlib stream when FLAG_COMPRESSED is also set), terminated by one
+# ordinary JSON frame with the same request id.
+HEADER = struct.Struct(">BII")
+FLAG_COMPRESSED = 0x01
+FLAG_STREAM = 0x02
+MAX_BODY_SIZE = 16 * 1024 * 1024  # Refuse anything larger, the stream is out of sync
+
+
+class ProtocolError(Exception):
+    """Raised when the byte stream does not contain a valid frame"""
+
+
+def encode_frame(request_id, message, flags=0):
+    """Encode a message dict into a frame"""
+    body = json.dumps(message, ensure_ascii=False).encode('utf-8')
+    return HEADER.pack(flags, request_id, len(body)) + body
+
+
+def decode_body(body):
+    """Decode the JSON body of a frame"""
+    try:
+        return json.loads(body.decode('utf-8'))
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ProtocolError(f"Invalid frame body: {e}")
+
+
+async def read_frame(reader):
+    """Read one (flags, request_id, body) frame from an asyncio stream"""
+    header = await reader.readexactly(HEADER.size)
+    flags, request_id, length = HEADER.unpack(header)
+    if length > MAX_BODY_SIZE:
+        raise ProtocolError(f"Frame body too large: {length} bytes")
+    body = await reader.readexactly(length)
+    return flags, request_id, body
+
+
+class StreamedReply:
+    """Chunks of a streamed reply, followed by its final JSON message"""
+
+    def __init__(self, dispatcher, request_id):
+        self.dispatcher = dispatcher
+        self.request_id = request_id
+        self.queue = asyncio.Queue()
+        self.compressed = False
+        self.final = None  # Final JSON message, set once all chunks were read
+
+    async def chunks(self, timeout=None):
+        """Yield the raw bytes of each chunk as it arrives"""
+        while True:
+            item = await asyncio.wait_for(self.queue.get(), timeout)
+            if isinstance(item, Exception):
+                raise item
+            if isinstance(item, dict):
+                self.final = item
+                return
+            yield item
+
+    def close(self):
+        """Stop receiving; chunks still in flight are dropped"""
+        self.dispatcher.pending.pop(self.request_id, None)
+        self.dispatcher.commands.pop(self.request_id, None)
+
+
+class AsyncDispatcher:
+    """Send framed requests on an asyncio stream and route each reply to its caller"""
+
+    def __init__(self, reader, writer, on_event=None, on_activity=None):
+        self.reader = reader
+        self.writer = writer
+        self.on_event = on_event  # Called with every message pushed by the device
+        self.on_activity = on_activity  # Called whenever a frame arrives, for liveness tracking
+        self.pending = {}
+        self.commands = {}  # request id -> command name, to account received bytes per command
+        self.ids = itertools.count(1)
+        self.closed = False
+
+    def __next_id(self):
+        # Request id 0 is reserved for messages the device sends on its own
+        return next(self.ids) % 0xFFFFFFFF + 1
+
+    async def run(self):
+        """Read frames until the connection closes"""
+        try:
+            while True:
+                flags, request_id, body = await read_frame(self.reader)
+                if self.on_activity is not None:
+                    self.on_activity()
+                command = "event" if request_id == 0 else self.commands.get(request_id, "unknown")
+                ROBOT_BYTES_RECEIVED.inc(HEADER.size + len(body), command=command)
+                if request_id == 0:
+                    if self.on_event is not None:
+                        self.on_event(decode_body(body))
+                    continue
+                target = self.pending.get(request_id)
+                if isinstance(target, StreamedReply):
+                    if flags & FLAG_STREAM:
+                        target.compressed = bool(flags & FLAG_COMPRESSED)
+                        target.queue.put_nowait(body)
+                    else:
+                        self.pending.pop(request_id, None)
+                        self.commands.pop(request_id, None)
+                        try:
+                            target.queue.put_nowait(decode_body(body))
+                        except ProtocolError as e:
+                            target.queue.put_nowait(e)
+                    continue
+                future = self.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue  # Late reply to a request that already timed out
+                try:
+                    future.set_result(decode_body(body))
+                except ProtocolError as e:
+                    future.set_exception(e)
+        except asyncio.IncompleteReadError:
+            print("Connection closed by client.")
+        except (OSError, ProtocolError) as e:
+            print(f"Connection error: {e}")
+        finally:
+            self.close()
+
+    async def request(self, message, timeout=None):
+        """Send a message and wait for the matching reply"""
+        if self.closed:
+            raise ConnectionError("Connection is closed")
+        request_id = self.__next_id()
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.commands[request_id] = command_label(message.get("cmd"))
+        try:
+            await self.__send(request_id, message)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(request_id, None)
+            self.commands.pop(request_id, None)
+
+    async def open_stream(self, message):
+        """Send a message whose reply is streamed and return the StreamedReply to read it from"""
+        if self.closed:
+            raise ConnectionError("Connection is closed")
+        request_id = self.__next_id()
+        reply = StreamedReply(self, request_id)
+        self.pending[request_id] = reply
+        self.commands[request_id] = command_label(message.get("cmd"))
+        await self.__send(request_id, message)
+        return reply
+
+    async def __send(self, request_id, message):
+        frame = encode_frame(request_id, message)
+        try:
+            self.writer.write(frame)
+            await self.writer.drain()
+        except OSError as e:
+            self.close()
+            raise ConnectionError(f"Send failed: {e}")
+        ROBOT_BYTES_SENT.inc(len(frame), command=command_label(message.get("cmd")))
+
+    def close(self):
+        """Close the stream and fail every request that is still waiting"""
+        self.closed = True
+        self.writer.close()
+        pending, self.pending = self.pending, {}
+        self.commands = {}
+        for target in pending.values():
+            if isinstance(target, StreamedReply):
+                target.queue.put_nowait(ConnectionError("Connection closed"))
+            elif not target.done():
+                target.set_exception(ConnectionError("Connection closed"))
@@ -0,0 +1,72 @@
+import struct
+from dataclasses import dataclass
+from typing import Tuple
+
+# Register addresses of the SOLAIR 1100LD, zero-based as pymodbus expects
+RECORD_COUNT_ADDRESS = 40024 - 40001  # Holding: number of records stored on the sensor
+RECORD_INDEX_ADDRESS = 40025 - 40001  # Holding: record loaded into the data registers
+DATA_ADDRESS = 30001 - 30001  # Input: start of the loaded record
+RECORD_SIZE = 100  # Input registers per record
+
+# Field types: struct code and number of 16-bit registers. 32-bit values are
+# stored high word first, so the whole record unpacks big-endian in one call.
+TYPES = {
+    "u16": ("H", 1),
+    "u32": ("I", 2),
+}
+
+
+@dataclass(frozen=True)
+class Field:
+    """A value at a register offset of a record"""
+    name: str
+    offset: int
+    type: str = "u32"
+
+
+class RegisterMap:
+    """Declarative layout of a block of registers, decoded with one compiled struct"""
+
+    def __init__(self, fields, size):
+        self.fields: Tuple[Field, ...] = tuple(sorted(fields, key=lambda field: field.offset))
+        self.size = size
+        self.names = tuple(field.name for field in self.fields)
+        # One format for the whole block: pad bytes skip the registers nobody reads
+        fmt = ">"
+        position = 0
+        for field in self.fields:
+            code, width = TYPES[field.type]
+            if field.offset < position:
+                raise ValueError(f"Field {field.name} overlaps the previous field")
+            fmt += "x" * ((field.offset - position) * 2) + code
+            position = field.offset + width
+        if position > size:
+            raise ValueError(f"Fields run past the {size} registers of the block")
+        self.struct = struct.Struct(fmt)
+        self.block = struct.Struct(f">{size}H")
+
+    def decode(self, registers):
+        """Return {name: value} for every field of the block"""
+        raw = self.block.pack(*registers[:self.size])
+        return dict(zip(self.names, self.struct.unpack_from(raw)))
+
+    def encode(self, values):
+        """Return the registers of a block holding {name: value}; missing fields are 0"""
+        raw = self.struct.pack(*(values.get(name, 0) for name in self.names))
+        return list(self.block.unpack(raw.ljust(self.block.size, b"\0")))
+
+
+# One record of the SOLAIR data registers (30001-30100). Every value is 32 bits
+# wide and takes two registers; the counts that used to be read as single
+# registers 9, 11, 17, ... are the low words of these.
+SOLAIR_RECORD = RegisterMap([
+    Field("timestamp", 0),  # Seconds since 1970-01-01, sensor clock
+    Field("sample_time", 2),  # Seconds the sample ran
+    Field("um01", 8),
+    Field("um02", 10),
+    Field("um03", 16),
+    Field("um05", 18),
+    Field("um07", 20),
+    Field("um10", 22),
+], RECORD_SIZE)
+
@@ -0,0 +1,47 @@
+import json
+import os
+from dotenv import load_dotenv
+
+# Load configuration from .env file
+load_dotenv()
+
+class ScrollIndex:
+    """Persistent map from a UI label to the scroll page where it was last found"""
+
+    def __init__(self, path=None):
+        default_path = os.path.join(os.path.expanduser("~"), ".keenon_rpa", "scroll_index.json")
+        self.path = path or os.getenv("SCROLL_INDEX_PATH", default_path)
+        self.pages = {}
+        self.load()
+
+    def load(self):
+        """Load the index from disk, starting empty if the file is missing or broken"""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.pages = {label: int(page) for label, page in json.load(f).items()}
+        except FileNotFoundError:
+            self.pages = {}
+        except (ValueError, TypeError, AttributeError) as e:
+            print(f"Ignoring broken scroll index {self.path}: {e}")
+            self.pages = {}
+
+    def save(self):
+        """Write the index to disk atomically"""
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.pages, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Could not save scroll index {self.path}: {e}")
+
+    def get(self, label):
+        """Return the page where the label was last found, or None"""
+        return self.pages.get(label)
+
+    def update(self, label, page):
+        """Remember the page where the label was found"""
+        if self.pages.get(label) != page:
+            self.pages[label] = page
+            self.save()
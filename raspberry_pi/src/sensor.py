@@ -1,65 +1,129 @@
-from pymodbus.client import ModbusTcpClient
-from pymodbus.exceptions import ModbusIOException
+from pymodbus.exceptions import ModbusException
 
 from dotenv import load_dotenv
 import os
 
+from .modbus_session import ModbusSession
+from .registers import SOLAIR_RECORD, RECORD_COUNT_ADDRESS, RECORD_INDEX_ADDRESS, DATA_ADDRESS, RECORD_SIZE
+
 import time
 import datetime
 
 # Load sensor configuration from .env file
 load_dotenv()
 
+def record_from_registers(registers, sensor=None, stored=False):
+    """
+    Build a DustMeasurements row from the 100 input registers of one SOLAIR record.
+    The row is timed now on the Pi, or for stored records (read back from the sensor's buffer)
+    with the record's timestamp read as a UTC epoch, which assumes the SOLAIR clock is set to UTC.
+    record_timestamp keeps the raw timestamp, whatever the clock convention: with the sensor
+    ("ip:slave") it identifies the record whichever way it reaches the database.
+    """
+    values = SOLAIR_RECORD.decode(registers)
+    if stored and values['timestamp']:
+        measured_at = datetime.datetime.fromtimestamp(values['timestamp'])
+    else:
+        measured_at = datetime.datetime.now()
+    return {
+        'measurement_datetime': measured_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'room': 'CR11',
+        'area': '1K',
+        'location_name': None,
+        'count': None,
+        'um01': values['um01'],
+        'um02': values['um02'],
+        'um03': values['um03'],
+        'um05': values['um05'],
+        'um07': values['um07'],
+        'um10': values['um10'],
+        'running_state': 1,
+        'alarm_high': None,
+        'sensor': sensor,
+        'record_timestamp': values['timestamp'],
+        'sample_time': values['sample_time'],  # Seconds the record sampled; not stored
+    }
+
+def read_records(slave, sensor=None, since=None, limit=None, stored=True):
+    """
+    The Modbus calls reading back the records stored on a SOLAIR, newest first, shared by
+    Sensor and MeasurementEngine, which only run them on their session. A generator: it yields
+    (operation, args, kwargs), takes each response, or the ModbusException a call raised, and
+    returns the rows oldest first. Stops at the first record not newer than since, compared
+    with its raw timestamp read as a UTC epoch, after limit records, or at a failed read.
+    """
+    found = []
+    since = since.timestamp() if since is not None else None
+    try:
+        response = yield "read_holding_registers", (), {"address": RECORD_COUNT_ADDRESS, "count": 1, "slave": slave}
+        if response.isError():
+            print("Error reading record count.")
+            return found
+        for index in range(response.registers[0] - 1, -1, -1):
+            if limit is not None and len(found) >= limit:
+                break
+            # Load the record into the data registers (40025), then read it from 30001
+            response = yield "write_register", (RECORD_INDEX_ADDRESS, index), {"slave": slave}
+            if not response.isError():
+                response = yield "read_input_registers", (DATA_ADDRESS,), {"count": RECORD_SIZE, "slave": slave}
+            if response.isError():
+                print(f"Error reading record {index}.")
+                break
+            record = record_from_registers(response.registers, sensor, stored)
+            if since is not None and record['record_timestamp'] <= since:
+                break
+            found.append(record)
+    except ModbusException as e:
+        print(f"Modbus IO Error during reading records: {e}")
+    return found[::-1]
+
 # Sensor class to manage the communication with the SOLAIR 1100LD device over Modbus TCP
 class Sensor:
-    def __init__(self):
-        # Initialize Modbus client with SOLAIR IP from .env file
-        self.client = ModbusTcpClient(os.getenv("SOLAIR_IP"))
+    def __init__(self, ip=None, slave=None, port=None):
+        # Share one Modbus session per SOLAIR, with the IP from .env file unless given explicitly
+        self.ip = ip or os.getenv("SOLAIR_IP")
+        self.port = int(port or os.getenv("SOLAIR_PORT", 502))
+        self.session = ModbusSession.for_host(self.ip, self.port)
         self.measurement_time = int(os.getenv("MEASUREMENT_TIME", 70))  # Default 70 seconds
-        self.slave = int(os.getenv("SLAVE"))
+        self.slave = int(slave if slave is not None else os.getenv("SLAVE"))
+        self.sensor_id = f"{self.ip}:{self.slave}"  # Stored with each record
 
         self.is_measuring = False
 
     def is_sensor_connected(self):
         """
-        Method to check if we can connect to SOLAIR 1100LD
+        Method to check if we can reach SOLAIR 1100LD, reusing the open session
         """
         print("Checking connection to SOLAIR 1100LD...")
         try:
-            if self.client.connect():
-                print("Connected to SOLAIR 1100LD.")
-                self.client.close()  # Close the connection after checking
-                return True
-            else:
-                print("Failed to connect to SOLAIR 1100LD.")
+            # Reading the record count proves the device answers, not just that the socket is open
+            response = self.session.call("read_holding_registers", address=RECORD_COUNT_ADDRESS, count=1, slave=self.slave)
+            if response.isError():
+                print(f"SOLAIR 1100LD answered with an error: {response}")
                 return False
-        except ModbusIOException as e:
-            print(f"Modbus IO Error during connection: {e}")
+            print("Connected to SOLAIR 1100LD.")
+            return True
+        except ModbusException as e:
+            print(f"Failed to connect to SOLAIR 1100LD: {e}")
             return False
         except Exception as e:
             print(f"Unexpected error during connection: {e}")
             return False
-        finally:
-            self.client.close()
 
     def start_measurement(self):
         """
         Method to start measurement on SOLAIR 1100LD
         """
         try:
-            if not self.client.is_socket_open():  # Check if socket is open
-                self.client.connect()  # Only connect if not already connected
-
-            self.client.write_register(1, 11,slave = self.slave)  # Start measurement command
+            self.session.call("write_register", 1, 11, slave=self.slave)  # Start measurement command
             self.is_measuring = True
             print("Measurement started.")
             time.sleep(self.measurement_time)  # Wait for the measurement to complete
-            self.client.write_register(1, 12,slave = self.slave)  # Stop measurement command
+            self.session.call("write_register", 1, 12, slave=self.slave)  # Stop measurement command
             self.is_measuring = False
             print("Measurement stopped.")
-            self.client.close()
 
-        except ModbusIOException as e:
+        except ModbusException as e:
             print(f"Modbus IO Error during measurement: {e}")
         except Exception as e:
             print(f"Measurement error: {e}")
@@ -69,67 +133,46 @@ class Sensor:
         Method to stop measurement on SOLAIR 1100LD
         """
         try:
-            if not self.client.is_socket_open():  # Check if socket is open
-                self.client.connect()  # Only connect if not already connected
-
-            self.client.write_register(1, 12,slave = self.slave)  # Stop measurement command
+            self.session.call("write_register", 1, 12, slave=self.slave)  # Stop measurement command
             print("Measurement stopped.")
-            self.client.close()
 
-        except ModbusIOException as e:
+        except ModbusException as e:
             print(f"Modbus IO Error during stop measurement: {e}")
         except Exception as e:
             print(f"Stop measurement error: {e}")
-        finally:
-            self.client.close()
 
     def read_data(self):
         """
         Method to read measurement data from SOLAIR 1100LD
         """
         try:
-            if not self.client.is_socket_open():  # Check if socket is open
-                self.client.connect()  # Only connect if not already connected
-
-            # Read the record count from the register (address 40024)
-            record_count = self.client.read_holding_registers(address=40024 - 40001, count=1, slave = self.slave)
-            self.client.write_register(40025 - 40001, record_count.registers[0] - 1, slave = self.slave)
+            # The newest record: count from 40024, loaded through 40025 and read from 30001
+            records = self.__run(read_records(self.slave, self.sensor_id, limit=1, stored=False))
+            return records[-1] if records else None
 
-            # Read the actual measurement data from the register (address 30001)
-            register_address = 30001 - 30001
-            response = self.client.read_input_registers(register_address, count=100, slave = self.slave)
-
-            # Check if there is an error in reading data
-            if response.isError():
-                print("Error reading record.")
-                return None
-                        
-            data = {
-                'measurement_datetime': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'room': 'CR11',
-                'area': '1K',
-                'location_name': None,
-                'count': None,
-                'um01': response.registers[9],
-                'um02': response.registers[11],
-                'um03': response.registers[17],
-                'um05': response.registers[19],
-                'um07': response.registers[21],
-                'um10': response.registers[23],
-                'running_state': 1,
-                'alarm_high': None,
-            }
-            #print(data)
-            self.client.close()
-            return data 
-
-        except ModbusIOException as e:
-            print(f"Modbus IO Error during reading data: {e}")
-            return None
         except Exception as e:
             print(f"Error reading data: {e}")
             return None
-        finally:
-            self.client.close()
-        
 
+    def backfill(self, since=None, limit=None):
+        """
+        Read back the records stored on the SOLAIR, oldest first, e.g. to recover measurements
+        taken while the network or the database was down. Walks from the newest record and
+        stops at the first one not newer than since (a datetime), or after limit records.
+        The rows are timed by the records, see record_from_registers, and so is since.
+        """
+        return self.__run(read_records(self.slave, self.sensor_id, since, limit))
+
+    def __run(self, steps):
+        # Run the Modbus calls of a generator like read_records on the session
+        try:
+            operation, args, kwargs = next(steps)
+            while True:
+                try:
+                    response = self.session.call(operation, *args, **kwargs)
+                except ModbusException as e:
+                    operation, args, kwargs = steps.throw(e)
+                else:
+                    operation, args, kwargs = steps.send(response)
+        except StopIteration as done:
+            return done.value
@@ -0,0 +1,101 @@
+import asyncio
+
+from .measurement import MeasurementEngine
+
+
+class SensorGroup:
+    """
+    Several SOLAIRs measured as one at each point, e.g. at different heights or with a
+    reference unit. Every sensor starts, samples and stops on its own task, so a point takes
+    as long as one measurement. The first sensor is the primary: its record decides the
+    result, and the others are stored at its location. Each record keeps its own sensor and
+    record time, the key it is stored under, so two sensors never collide.
+    """
+
+    def __init__(self, sensors, names=None):
+        self.sensors = list(sensors)
+        if not self.sensors:
+            raise ValueError("A sensor group needs at least one sensor")
+        self.names = list(names) if names is not None else [sensor.ip for sensor in self.sensors]
+        self.measured = []  # Names of the sensors behind the records of the last measure()
+
+    @classmethod
+    def from_spec(cls, spec):
+        """
+        Build a group from "[name@]ip:slave" entries separated by commas,
+        e.g. "192.168.1.50:1,high@192.168.1.51:1,ref@192.168.1.52:1".
+        An empty spec gives the sensor of SOLAIR_IP and SLAVE alone.
+        """
+        sensors, names = [], []
+        for entry in filter(None, (entry.strip() for entry in (spec or "").split(","))):
+            name, _, address = entry.rpartition("@")
+            ip, slave = address.rsplit(":", 1)
+            sensors.append(MeasurementEngine(ip.strip(), int(slave)))
+            names.append(name.strip() or ip.strip())
+        if not sensors:
+            sensor = MeasurementEngine()
+            return cls([sensor], [sensor.ip])
+        return cls(sensors, names)
+
+    @property
+    def primary(self):
+        return self.sensors[0]
+
+    @property
+    def is_measuring(self):
+        return any(sensor.is_measuring for sensor in self.sensors)
+
+    @property
+    def stopped(self):
+        return any(sensor.stopped for sensor in self.sensors)
+
+    async def is_sensor_connected(self):
+        """True when every sensor of the group answers"""
+        results = await asyncio.gather(*(sensor.is_sensor_connected() for sensor in self.sensors))
+        for name, connected in zip(self.names, results):
+            if not connected:
+                print(f"Sensor {name} not connected")
+        return all(results)
+
+    def stop(self):
+        """Stop every running measurement of the group"""
+        for sensor in self.sensors:
+            sensor.stop()
+
+    async def measure(self, progress=None, rule=None, on_sample=None):
+        """
+        Measure with all sensors at once and return their records, primary first, or None if
+        the primary failed or was stopped. progress and on_sample follow the primary; the
+        rule stops each sensor on its own counts. Records of failed secondaries are left out.
+        """
+        tasks = [self.primary.measure(progress, rule, on_sample)]
+        tasks += [sensor.measure(rule=rule) for sensor in self.sensors[1:]]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        primary = results[0]
+        if isinstance(primary, BaseException):
+            raise primary
+        if primary is None:
+            return None
+        records = [primary]
+        self.measured = [self.names[0]]
+        for name, result in zip(self.names[1:], results[1:]):
+            if isinstance(result, BaseException) or result is None:
+                print(f"No data from sensor {name}: {result}")
+                continue
+            records.append(result)
+            self.measured.append(name)
+        return records
+
+    def locate(self, records, point):
+        """Set the location of each record: the point for the primary, point/name for the others"""
+        for index, (record, name) in enumerate(zip(records, self.measured)):
+            record['location_name'] = point if index == 0 else f"{point}/{name}"
+        return records
+
+    async def backfill(self, since=None, limit=None):
+        """
+        Read back the stored records of every sensor at once, see MeasurementEngine.backfill.
+        Records of different sensors may share a second; their sensor column tells them apart.
+        """
+        results = await asyncio.gather(*(sensor.backfill(since, limit) for sensor in self.sensors))
+        return [record for records in results for record in records]
@@ -0,0 +1,170 @@
+from dotenv import load_dotenv
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .storage import COLUMNS, NATURAL_KEYS
+from .metrics import SPOOL_DEPTH, SPOOL_LAG_SECONDS, SPOOL_SPOOLED_ROWS, SPOOL_REPLAYED_ROWS
+
+# Load configuration from .env file
+load_dotenv()
+
+class Spool:
+    """
+    Append-only SQLite file holding rows the database has not accepted yet, so they survive
+    a restart. Every row carries an idempotency key built from its table's natural key:
+    spooling the same row twice keeps one copy.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("SPOOL_PATH", "spool.db")
+        self.lock = threading.Lock()  # The writer and the replayer use it from worker threads
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL and NORMAL sync: an append is a local write, not a wait on the disk's flush
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS spool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                key TEXT NOT NULL UNIQUE,
+                row TEXT NOT NULL,
+                spooled_at REAL NOT NULL
+            )""")
+        self.conn.commit()
+        self.update_metrics()
+
+    @staticmethod
+    def key(table, row):
+        """Idempotency key of a row: its table and natural key values"""
+        return json.dumps([table] + [row[COLUMNS[table].index(column)] for column in NATURAL_KEYS[table]])
+
+    def append(self, table, rows):
+        """Store rows for a table; returns how many were new"""
+        now = time.time()
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO spool (table_name, key, row, spooled_at) VALUES (?, ?, ?, ?)",
+                [(table, self.key(table, row), json.dumps(list(row)), now) for row in rows])
+            self.conn.commit()
+            added = self.conn.total_changes - before
+        SPOOL_SPOOLED_ROWS.inc(added, table=table)
+        self.update_metrics()
+        return added
+
+    def peek(self, table, limit):
+        """The oldest rows of a table as (ids, rows)"""
+        with self.lock:
+            found = self.conn.execute(
+                "SELECT id, row FROM spool WHERE table_name = ? ORDER BY id LIMIT ?", (table, limit)).fetchall()
+        # Rows spooled before a column was added get NULL for it
+        rows = [json.loads(row) for _, row in found]
+        rows = [tuple(row + [None] * (len(COLUMNS[table]) - len(row))) for row in rows]
+        return [id for id, _ in found], rows
+
+    def remove(self, ids):
+        """Drop rows once the database has them"""
+        with self.lock:
+            self.conn.executemany("DELETE FROM spool WHERE id = ?", [(id,) for id in ids])
+            self.conn.commit()
+        self.update_metrics()
+
+    def depth(self, table=None):
+        with self.lock:
+            if table is None:
+                return self.conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+            return self.conn.execute("SELECT COUNT(*) FROM spool WHERE table_name = ?", (table,)).fetchone()[0]
+
+    def lag(self):
+        """Seconds since the oldest row was spooled, 0 when empty"""
+        with self.lock:
+            oldest = self.conn.execute("SELECT MIN(spooled_at) FROM spool").fetchone()[0]
+        return time.time() - oldest if oldest is not None else 0.0
+
+    def update_metrics(self):
+        for table in COLUMNS:
+            SPOOL_DEPTH.set(self.depth(table), table=table)
+        SPOOL_LAG_SECONDS.set(self.lag())
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class SpoolReplayer:
+    """
+    Writes rows to the database, or to the spool while the database is unreachable, and
+    drains the spool in large batches as soon as the database answers again.
+    Replays insert with unique=True, so rows committed just before a failure are not doubled.
+    """
+
+    def __init__(self, spool, inserts, batch=None, retry_min=None, retry_max=None):
+        self.spool = spool
+        self.inserts = inserts  # table -> insert(rows, unique=False), e.g. Database.save_measurement
+        self.batch = int(batch or os.getenv("SPOOL_BATCH", 500))
+        self.retry_min = float(retry_min or os.getenv("SPOOL_RETRY_MIN", 1))
+        self.retry_max = float(retry_max or os.getenv("SPOOL_RETRY_MAX", 30))
+        self.retry = self.retry_min
+        self.task = None
+
+    def write(self, table, rows):
+        """
+        Insert rows, spooling them if the database fails. While older rows are still spooled
+        the new ones are spooled behind them, instead of waiting on a database that is down.
+        """
+        if self.spool.depth(table):
+            self.spool.append(table, rows)
+            return
+        try:
+            self.inserts[table](rows)
+        except Exception as e:
+            print(f"Database error: {e}. Spooling {len(rows)} rows for {table}.")
+            self.spool.append(table, rows)
+
+    def replay(self):
+        """Move one batch per table from the spool to the database; returns the rows moved"""
+        moved = 0
+        for table, insert in self.inserts.items():
+            ids, rows = self.spool.peek(table, self.batch)
+            if not rows:
+                continue
+            insert(rows, unique=True)
+            self.spool.remove(ids)
+            SPOOL_REPLAYED_ROWS.inc(len(rows), table=table)
+            moved += len(rows)
+        return moved
+
+    def start(self):
+        """Start draining the spool on the running loop"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.__run())
+        return self.task
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def __run(self):
+        while True:
+            self.spool.update_metrics()  # Lag keeps growing while the database is down
+            if not self.spool.depth():
+                await asyncio.sleep(self.retry_min)
+                continue
+            try:
+                moved = await asyncio.to_thread(self.replay)
+                print(f"Replayed {moved} spooled rows, {self.spool.depth()} left")
+                self.retry = self.retry_min
+                if not moved:
+                    await asyncio.sleep(self.retry_min)  # Rows of a table nobody inserts
+            except Exception as e:
+                print(f"Replay failed: {e}. Next try in {self.retry:.1f}s")
+                await asyncio.sleep(self.retry)
+                self.retry = min(self.retry * 2, self.retry_max)
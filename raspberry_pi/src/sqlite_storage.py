@@ -0,0 +1,131 @@
+from dotenv import load_dotenv
+import argparse
+import os
+import sqlite3
+import threading
+
+from .mssql_storage import MSSQLStorage
+from .storage import Storage, COLUMNS, NATURAL_KEYS
+
+# Load configuration from .env file
+load_dotenv()
+
+# Same tables as on SQL Server, plus a flag for the rows already synced to it
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS DustMeasurements (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        measurement_datetime TEXT, room TEXT, area TEXT, location_name TEXT, count INTEGER,
+        um01 INTEGER, um02 INTEGER, um03 INTEGER, um05 INTEGER, um07 INTEGER, um10 INTEGER,
+        running_state INTEGER, alarm_high INTEGER, sensor TEXT, record_timestamp INTEGER,
+        synced INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS DustMeasurements_record_key ON DustMeasurements (record_timestamp, sensor);
+    CREATE INDEX IF NOT EXISTS DustMeasurements_unsynced ON DustMeasurements (synced, id);
+    CREATE TABLE IF NOT EXISTS ActivityLogs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        log_timestamp TEXT, location_name TEXT, activity TEXT,
+        synced INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS ActivityLogs_key ON ActivityLogs (log_timestamp, location_name, activity);
+    CREATE INDEX IF NOT EXISTS ActivityLogs_unsynced ON ActivityLogs (synced, id);
+"""
+
+# DustMeasurements columns added after the first schema, for older files
+ADDED_COLUMNS = {"sensor": "TEXT", "record_timestamp": "INTEGER"}
+
+def insert_query(table, unique=False):
+    # INSERT for one row; IS compares NULLs as equal, like the natural key check on SQL Server
+    columns = ", ".join(COLUMNS[table])
+    values = ", ".join(["?"] * len(COLUMNS[table]))
+    if not unique:
+        return f"INSERT INTO {table} ({columns}) VALUES ({values})"
+    match = " AND ".join(f"{column} IS ?" for column in NATURAL_KEYS[table])
+    return f"INSERT INTO {table} ({columns}) SELECT {values} WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {match})"
+
+# Local SQLite backend for edge and test runs, at SQLITE_PATH
+class SQLiteStorage(Storage):
+    name = "sqlite"
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("SQLITE_PATH", "dust.db")
+        self.lock = threading.Lock()  # One connection, used from the writer's worker threads
+        # Statements are compiled once and reused from the connection's cache
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=64)
+        # WAL: readers never block the writer; NORMAL sync: a commit does not wait for fsync
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.__migrate()
+        self.conn.executescript(SCHEMA)
+        self.queries = {(table, unique): insert_query(table, unique) for table in COLUMNS for unique in (False, True)}
+        self.key_indexes = {table: [COLUMNS[table].index(column) for column in NATURAL_KEYS[table]] for table in COLUMNS}
+
+    def __migrate(self):
+        # Files made before the sensor columns: add them, and drop the indexes of the old natural keys
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(DustMeasurements)")]
+        if not columns:
+            return
+        with self.conn:
+            for column, type in ADDED_COLUMNS.items():
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE DustMeasurements ADD COLUMN {column} {type}")
+            self.conn.execute("DROP INDEX IF EXISTS DustMeasurements_key")
+            self.conn.execute("DROP INDEX IF EXISTS DustMeasurements_record")
+
+    def is_connected(self):
+        with self.lock:
+            version = self.conn.execute("SELECT sqlite_version()").fetchone()[0]
+        print(f"Using SQLite {version} at {self.path}")
+        return True
+
+    def insert(self, table, rows, unique=False):
+        if unique:
+            rows = [tuple(row) + tuple(row[i] for i in self.key_indexes[table]) for row in rows]
+        # One transaction per batch
+        with self.lock, self.conn:
+            self.conn.executemany(self.queries[(table, unique)], rows)
+
+    def sync(self, target, batch=500):
+        """
+        Copy the rows not yet synced to another backend, e.g. SQL Server after a disconnected run.
+        Rows go in batches with unique=True, so an interrupted sync can simply be run again.
+        Returns the number of rows copied.
+        """
+        copied = 0
+        for table in COLUMNS:
+            columns = ", ".join(COLUMNS[table])
+            while True:
+                with self.lock:
+                    found = self.conn.execute(
+                        f"SELECT id, {columns} FROM {table} WHERE synced = 0 ORDER BY id LIMIT ?", (batch,)).fetchall()
+                if not found:
+                    break
+                target.insert(table, [tuple(row[1:]) for row in found], unique=True)
+                with self.lock, self.conn:
+                    self.conn.executemany(f"UPDATE {table} SET synced = 1 WHERE id = ?", [(row[0],) for row in found])
+                copied += len(found)
+                print(f"Synced {copied} rows")
+        return copied
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the local SQLite database to SQL Server")
+    parser.add_argument("--path", default=None, help="SQLite file, SQLITE_PATH by default")
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    local = SQLiteStorage(args.path)
+    remote = MSSQLStorage()
+    try:
+        print(f"Synced {local.sync(remote, args.batch)} rows to SQL Server")
+    finally:
+        local.close()
+        remote.close()
+
+
+if __name__ == "__main__":
+    main()
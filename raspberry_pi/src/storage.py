@@ -0,0 +1,36 @@
+# Columns of the tables, in the order of the row tuples
+COLUMNS = {
+    "DustMeasurements": ("measurement_datetime", "room", "area", "location_name", "count", "um01", "um02",
+                         "um03", "um05", "um07", "um10", "running_state", "alarm_high", "sensor",
+                         "record_timestamp"),
+    "ActivityLogs": ("log_timestamp", "location_name", "activity"),
+}
+# Columns that identify a row, so a row written twice (e.g. replayed after a lost commit) is stored once.
+# A measurement is a SOLAIR record: its raw timestamp on the sensor clock and the sensor
+# ("ip:slave"), the same whether the row was saved live or read back later by a backfill.
+NATURAL_KEYS = {
+    "DustMeasurements": ("record_timestamp", "sensor"),
+    "ActivityLogs": ("log_timestamp", "location_name", "activity"),
+}
+
+def row(table, record):
+    """Row tuple of a record dict in COLUMNS order; keys that are not columns are left out"""
+    return tuple(record.get(column) for column in COLUMNS[table])
+
+class Storage:
+    """
+    Storage backend behind Database. Rows are tuples in COLUMNS order; insert() writes a
+    list of them in one transaction and raises on failure, so the caller can spool them.
+    """
+    name = None
+
+    def is_connected(self):
+        """True when the backend can be written to"""
+        raise NotImplementedError
+
+    def insert(self, table, rows, unique=False):
+        """Insert rows into a table; with unique, rows whose natural key is stored are skipped"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
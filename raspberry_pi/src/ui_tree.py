@@ -0,0 +1,161 @@
+import re
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+# One line of the getFullUI dump built by MyAccessibilityService.buildFullHierarchy:
+#   "<2 spaces per depth> Node: <class>, Text: <text>, Clickable: <bool>, Visible: <bool>,
+#    Children: <n>, Scrollable: <bool>, Bounds: [left,top][right,bottom]"
+# Text is matched greedily so labels containing ", " still parse. Bounds is optional
+# because older builds of the service do not send it.
+NODE_PATTERN = re.compile(
+    r'^(?P<indent> *) Node: (?P<class_name>.*?), Text: (?P<text>.*), '
+    r'Clickable: (?P<clickable>true|false), Visible: (?P<visible>true|false), '
+    r'Children: (?P<children>\d+), Scrollable: (?P<scrollable>true|false)'
+    r'(?:, Bounds: \[(?P<left>-?\d+),(?P<top>-?\d+)\]\[(?P<right>-?\d+),(?P<bottom>-?\d+)\])?$'
+)
+
+
+@dataclass
+class UINode:
+    """A single accessibility node from the device"""
+    class_name: str
+    text: Optional[str]
+    clickable: bool
+    visible: bool
+    scrollable: bool
+    bounds: Optional[Tuple[int, int, int, int]] = None
+    depth: int = 0
+    parent: Optional["UINode"] = field(default=None, repr=False)
+    children: List["UINode"] = field(default_factory=list, repr=False)
+
+    @classmethod
+    def from_line(cls, line):
+        """Parse one line of the hierarchy dump, or return None if it is not a node line"""
+        match = NODE_PATTERN.match(line.rstrip('\r'))
+        if match is None:
+            return None
+        text = match['text']
+        bounds = None
+        if match['left'] is not None:
+            bounds = (int(match['left']), int(match['top']), int(match['right']), int(match['bottom']))
+        return cls(
+            class_name=match['class_name'],
+            text=None if text == 'null' else text,
+            clickable=match['clickable'] == 'true',
+            visible=match['visible'] == 'true',
+            scrollable=match['scrollable'] == 'true',
+            bounds=bounds,
+            depth=len(match['indent']) // 2,
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a node from a queryUI reply entry"""
+        bounds = data.get('bounds')
+        return cls(
+            class_name=data.get('class_name') or '',
+            text=data.get('text'),
+            clickable=bool(data.get('clickable')),
+            visible=bool(data.get('visible')),
+            scrollable=bool(data.get('scrollable')),
+            bounds=tuple(bounds) if bounds else None,
+        )
+
+    def clickable_target(self):
+        """Return the node a click on this one lands on: itself or its nearest clickable parent"""
+        node = self
+        while node is not None and not node.clickable:
+            node = node.parent
+        return node
+
+
+class UITree:
+    """Parsed accessibility hierarchy of one screen with a text index"""
+
+    def __init__(self):
+        self.nodes: List[UINode] = []
+        self.index: Dict[str, List[UINode]] = {}
+        self.stack: List[UINode] = []
+        self.fingerprint: Optional[str] = None  # Device hash of the screen, set for complete dumps only
+
+    @classmethod
+    def parse(cls, dump):
+        """Parse a full getFullUI dump"""
+        tree = cls()
+        for line in dump.splitlines():
+            tree.add_line(line)
+        return tree
+
+    def add_line(self, line):
+        """Add one line of the dump to the tree and return the parsed node"""
+        node = UINode.from_line(line)
+        if node is None:
+            return None
+
+        # The dump is a pre-order walk, so the parent is the last node one level up
+        while self.stack and self.stack[-1].depth >= node.depth:
+            self.stack.pop()
+        if self.stack:
+            node.parent = self.stack[-1]
+            node.parent.children.append(node)
+        self.stack.append(node)
+
+        self.nodes.append(node)
+        if node.text is not None:
+            self.index.setdefault(node.text, []).append(node)
+        return node
+
+    def find(self, text):
+        """Return every node whose text equals the given text"""
+        return self.index.get(text, [])
+
+    def find_all(self, texts):
+        """
+        Match many texts in one pass over the screen.
+        Returns {text: first node with that text} for every text present, in screen order.
+        """
+        targets = set(texts)
+        found = {}
+        for node in self.nodes:
+            if node.text in targets and node.text not in found:
+                found[node.text] = node
+        return found
+
+    def has(self, text):
+        """Check if a node with exactly this text is on the screen"""
+        return text in self.index
+
+    def __len__(self):
+        return len(self.nodes)
+
+
+class UITreeStreamParser:
+    """Build a UITree from chunks of a getFullUI dump as they arrive, optionally zlib-compressed"""
+
+    def __init__(self, compressed=False):
+        self.tree = UITree()
+        self.decompressor = zlib.decompressobj() if compressed else None
+        self.buffer = bytearray()  # Bytes of the line that is not complete yet
+
+    def feed(self, chunk):
+        """Parse the complete lines in a chunk and return the nodes they contain"""
+        if self.decompressor is not None:
+            chunk = self.decompressor.decompress(chunk)
+        self.buffer += chunk
+        end = self.buffer.rfind(b'\n')
+        if end < 0:
+            return []
+        # Splitting on the newline byte never cuts a multi-byte UTF-8 character in half
+        lines = bytes(self.buffer[:end]).decode('utf-8', errors='replace').split('\n')
+        del self.buffer[:end + 1]
+        return [node for node in map(self.tree.add_line, lines) if node is not None]
+
+    def close(self):
+        """Parse whatever is left and return the finished tree"""
+        if self.decompressor is not None:
+            self.buffer += self.decompressor.flush()
+        if self.buffer:
+            self.tree.add_line(bytes(self.buffer).decode('utf-8', errors='replace'))
+            self.buffer.clear()
+        return self.tree
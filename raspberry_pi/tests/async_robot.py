@@ -0,0 +1,16 @@
+from src import AsyncRobot
+import asyncio
+
+async def test_async_robot():
+    robot = AsyncRobot()
+
+    await robot.start_server()
+    await robot.connected.wait()
+    await robot.send_command("goHome")
+    await robot.send_command("Settings")
+    print(await robot.is_have_ui("Display"))
+    print(await robot.search_ui("Security"))
+    await robot.stop_server()
+    
+if __name__ == "__main__":
+    asyncio.run(test_async_robot())
@@ -1,4 +1,5 @@
 from src import Database
+import time
 
 def test_db():
     db = Database()
@@ -20,5 +21,26 @@ def test_db():
 
     print("Done")
 
+def test_pool():
+    db = Database()
+
+    # Only the first insert logs in, the others reuse the pooled connection
+    for i in range(10):
+        start = time.perf_counter()
+        db.save_activity_log((f"2025-03-31 12:00:{i:02d}", "IS-1K-019", "Pool test"))
+        print(f"Insert {i}: {(time.perf_counter() - start) * 1000:.1f} ms")
+    print(f"Connections opened: {db.storage.pool.opened}")
+    db.close()
+
+def test_sqlite():
+    # Local backend, as with DB_BACKEND=sqlite
+    db = Database("sqlite")
+    print(db.is_database_connected())
+    db.save_measurement([("2025-03-31 12:00:00", "CR11", "1K", "IS-1K-019", 1, 1304, 500, 118, 67, 20, 5, 1, 1, "192.168.1.50:1", 1743422400)])
+    db.save_activity_log(("2025-03-31 12:00:00", "IS-1K-019", "SQLite test"))
+    db.close()
+
 if __name__ == "__main__":
-    test_db()
\ No newline at end of file
+    test_db()
+    test_pool()
+    test_sqlite()
\ No newline at end of file
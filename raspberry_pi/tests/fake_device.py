@@ -0,0 +1,36 @@
+from src import AsyncRobot
+from tests.fakes.device import FakeDevice
+import asyncio
+import time
+
+async def test_fake_device():
+    robot = AsyncRobot()
+    await robot.start_server()
+    device = FakeDevice(port=robot.server_port, points=80, latency=0.02, travel_time=1, confirm_time=0.5)
+    device_task = asyncio.create_task(device.run())
+    await robot.connected.wait()
+
+    start = time.perf_counter()
+    await robot.run_macro("open_delivery")
+    await robot.run_macro("open_direct")
+    print(await robot.search_ui_and_click_all(["Point 3", "Point 65", "Point 77"]))
+    print(f"Selected 3 points in {time.perf_counter() - start:.2f}s, {len(device.log)} commands")
+
+    await robot.send_command("Go")
+    for _ in range(3):
+        print(await robot.wait_for_ui("OK", timeout=10))
+        await robot.wait_for_ui(lambda ui: not ui.has("OK"), timeout=10)
+    print(await robot.wait_for_ui("Go", timeout=10))
+
+    # The link drops and the device reconnects on its own
+    device.disconnect()
+    await asyncio.sleep(0.1)
+    print(await robot.send_command("ping"))  # Waits for the reconnect
+    print(robot.connection_state())
+
+    device.stop()
+    device_task.cancel()
+    await robot.stop_server()
+
+if __name__ == "__main__":
+    asyncio.run(test_fake_device())
@@ -0,0 +1,73 @@
+from src import MeasurementEngine, Sensor, EarlyStopRule
+from src.registers import RECORD_SIZE
+from tests.fakes.sensor import FakeSensor
+import asyncio
+import threading
+import time
+
+async def test_fake_sensor():
+    # Live counts in a block of their own (30101), like LIVE_DATA_ADDRESS=30101
+    fake = FakeSensor(port=0, records=20, latency=0.002, live_address=RECORD_SIZE)
+    await fake.start()
+    engine = MeasurementEngine("127.0.0.1", 1, port=fake.port)
+    engine.measurement_time = 5
+    engine.live_address = RECORD_SIZE
+
+    # Measure, reading the live counts on the way
+    record = await engine.measure(on_sample=lambda elapsed, record: print(f"Live um03 after {elapsed:.0f}s: {record['um03']}"))
+    print(f"Measurement data: {record}")
+
+    # A dirty room is decided NG before the sample ends
+    fake.profile = {"um03": 60000}
+    start = time.perf_counter()
+    record = await engine.measure(rule=EarlyStopRule(1000, mode="ng"))
+    print(f"{engine.decision} after {time.perf_counter() - start:.1f}s, um03 {record['um03']}")
+
+    # Latency of reading the latest record
+    start = time.perf_counter()
+    for _ in range(50):
+        await engine.read_data()
+    print(f"read_data: {(time.perf_counter() - start) / 50 * 1000:.1f} ms")
+
+    # Records stored during an outage are read back in one go
+    records = await engine.backfill()
+    print(f"Backfilled {len(records)} records, {records[0]['measurement_datetime']} to {records[-1]['measurement_datetime']}")
+
+    # The session reconnects after the link drops
+    fake.disconnect()
+    print(f"After disconnect: {await engine.is_sensor_connected()}")
+
+    await fake.stop()
+
+async def test_stale_live_read():
+    # Real register model: 30001 keeps the last loaded record while sampling
+    fake = FakeSensor(port=0, profile="dirty")
+    await fake.start()
+    engine = MeasurementEngine("127.0.0.1", 1, port=fake.port)
+    engine.measurement_time = 6
+    await engine.measure()
+
+    # A clean point after a dirty one is not decided on the dirty record
+    fake.profile = {"um03": 0}
+    record = await engine.measure(rule=EarlyStopRule(1000, mode="ng"))
+    print(f"Decision {engine.decision}, um03 {record['um03']}")
+    await fake.stop()
+
+def test_fake_sensor_sync():
+    # The synchronous Sensor against a simulator running on its own thread
+    loop = asyncio.new_event_loop()
+    fake = FakeSensor(port=0, records=3)
+    loop.run_until_complete(fake.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    sensor = Sensor("127.0.0.1", 1, port=fake.port)
+    print(sensor.is_sensor_connected())
+    print(f"Measurement data: {sensor.read_data()}")
+    print(f"Stored records: {len(sensor.backfill())}")
+    loop.call_soon_threadsafe(loop.stop)
+
+if __name__ == "__main__":
+    asyncio.run(test_fake_sensor())
+    asyncio.run(test_stale_live_read())
+    test_fake_sensor_sync()
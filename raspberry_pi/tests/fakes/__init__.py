@@ -0,0 +1 @@
+# Simulated devices for the manual tests; not part of the API package
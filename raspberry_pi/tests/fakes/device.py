@@ -0,0 +1,398 @@
+import argparse
+import asyncio
+import hashlib
+import random
+import zlib
+
+from src.protocol import FLAG_COMPRESSED, FLAG_STREAM, HEADER, ProtocolError, decode_body, encode_frame, read_frame
+
+# Screen size and row height of the simulated phone, used for node bounds
+SCREEN_WIDTH = 1080
+ROW_HEIGHT = 120
+STREAM_CHUNK_SIZE = 16 * 1024  # Same slice size as MyAccessibilityService.sendStreamedResponse
+
+class FakeDevice:
+    """
+    Simulated phone running MyAccessibilityService and the Keenon delivery app.
+    Connects to the robot server and speaks the same framed protocol, so AsyncRobot, Robot and
+    RobotFleet can be exercised and benchmarked on a plain Linux box.
+
+    Screens: home -> Peanut Food Delivery -> (back button) menu -> Direct -> point list.
+    Points are toggled by clicking them; Go drives to every selected point in turn. At each
+    point the robot waits on an OK screen until OK is clicked or confirm_time has passed,
+    then returns to the point list once the last point is done.
+    """
+
+    def __init__(self, host="127.0.0.1", port=12345, device_id="fake-device", points=50, page_size=8,
+                 latency=0.0, jitter=0.0, travel_time=2.0, confirm_time=1.0, sticky_end=False,
+                 disconnect_after=None, drop_rate=0.0, reconnect_delay=1.0, seed=None):
+        self.host = host
+        self.port = port
+        self.device_id = device_id
+        self.points = points if isinstance(points, list) else [f"Point {i + 1}" for i in range(points)]
+        self.page_size = page_size  # Rows of the point list visible at once
+        self.latency = latency  # Seconds added before every reply
+        self.jitter = jitter  # Extra random delay of up to this many seconds
+        self.travel_time = travel_time  # Seconds from Go, or from the previous point, to a point
+        self.confirm_time = confirm_time  # Seconds the OK screen stays up if nobody clicks OK
+        self.sticky_end = sticky_end  # Scrolling past the end still reports success, like some lists do
+        self.disconnect_after = disconnect_after  # Drop the link after this many commands
+        self.drop_rate = drop_rate  # Chance of dropping the link on any command
+        self.reconnect_delay = reconnect_delay
+        self.random = random.Random(seed)
+
+        self.screen = "home"
+        self.offset = 0  # Index of the first visible point
+        self.selected = []  # Selected points in click order
+        self.trip = []  # Points still to visit
+        self.travel_task = None
+        self.confirmed = asyncio.Event()
+        self.commands = 0  # Commands received over all connections
+        self.log = []  # Every command received, in order
+        self.writer = None
+        self.running = False
+
+    # --- connection ---
+
+    async def run(self):
+        """Connect to the server, reconnecting after every drop until stop() is called"""
+        self.running = True
+        while self.running:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            except OSError as e:
+                print(f"Fake device {self.device_id}: connect failed: {e}")
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+            await self.serve(reader, writer)
+            if self.running:
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def serve(self, reader, writer):
+        """Handle one connection until it closes"""
+        self.writer = writer
+        print(f"Fake device {self.device_id}: connected to {self.host}:{self.port}")
+        await self.send(0, {"event": "hello", "device_id": self.device_id})
+        tasks = set()
+        try:
+            while True:
+                flags, request_id, body = await read_frame(reader)
+                self.commands += 1
+                if self.disconnect_after is not None and self.commands > self.disconnect_after:
+                    self.disconnect_after = None  # Drop once, then behave
+                    break
+                if self.drop_rate and self.random.random() < self.drop_rate:
+                    break
+                # The service answers every command on its own thread, so replies may overtake each other
+                task = asyncio.create_task(self.handle(request_id, decode_body(body)))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, OSError, ProtocolError):
+            pass
+        finally:
+            print(f"Fake device {self.device_id}: disconnected")
+            for task in tasks:
+                task.cancel()
+            self.writer = None
+            writer.close()
+
+    def disconnect(self):
+        """Drop the current connection, as if the Wi-Fi went away"""
+        if self.writer is not None:
+            self.writer.transport.abort()
+
+    def stop(self):
+        """Stop reconnecting and drop the connection"""
+        self.running = False
+        if self.travel_task is not None:
+            self.travel_task.cancel()
+        self.disconnect()
+
+    async def send(self, request_id, message):
+        await self.write(encode_frame(request_id, message))
+
+    async def send_raw(self, flags, request_id, body):
+        await self.write(HEADER.pack(flags, request_id, len(body)) + body)
+
+    async def write(self, data):
+        writer = self.writer
+        if writer is None:
+            return
+        try:
+            # One write per frame, so frames from concurrent handlers never interleave
+            writer.write(data)
+            await writer.drain()
+        except OSError:
+            pass
+
+    # --- commands ---
+
+    async def handle(self, request_id, message):
+        """Answer one request the way MyAccessibilityService does"""
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if message.get("cmd") == "getFullUI" and message.get("stream"):
+            self.log.append("getFullUI")
+            await self.send_streamed(request_id, self.dump(), message.get("compress", False))
+            return
+        await self.send(request_id, await self.execute(message))
+
+    async def execute(self, message):
+        """Run one command and return its reply"""
+        command = message.get("cmd", "")
+        self.log.append(command)
+
+        if command == "ping":
+            reply = {"response": "pong"}
+        elif command == "getFullUI":
+            hierarchy = self.dump()
+            reply = {"response": hierarchy, "fingerprint": self.fingerprint(hierarchy)}
+        elif command == "exists":
+            found = self.find(message.get("text")) is not None
+            reply = {"response": str(found).lower(), "found": found}
+        elif command == "queryUI":
+            nodes = [self.node_json(node) for node in self.nodes() if node[2] == message.get("text")]
+            nodes = nodes[:message.get("limit", 20)]
+            reply = {"response": f"{len(nodes)} nodes", "nodes": nodes}
+        elif command == "macro":
+            reply = await self.run_macro(message.get("steps", []), message.get("stop_on_failure", True))
+        else:
+            reply = {"response": self.perform(command)}
+
+        # Acknowledge once the screen has settled; the simulated screen settles immediately
+        if "settle_ms" in message:
+            await asyncio.sleep(message["settle_ms"] / 1000)
+            reply["settled"] = True
+        if message.get("fingerprint"):
+            reply["fingerprint"] = self.fingerprint(self.dump())
+        return reply
+
+    async def run_macro(self, steps, stop_on_failure):
+        results = []
+        ok = True
+        for step in steps:
+            result = dict(await self.execute(step), cmd=step.get("cmd"))
+            if self.failed_step(result.get("response", "")):
+                ok = False
+            if step.get("wait_for"):
+                found = await self.wait_for(step["wait_for"], step.get("wait_timeout_ms", 10000) / 1000)
+                result.update(wait_for=step["wait_for"], found=found)
+                ok = ok and found
+            results.append(result)
+            if not ok and stop_on_failure:
+                break
+        return {"response": "Macro completed" if ok else "Macro failed", "ok": ok, "results": results}
+
+    @staticmethod
+    def failed_step(response):
+        # Same rule as MyAccessibilityService.isFailedStep: the element to click was missing
+        return (response.startswith("Command not found in UI") or response.startswith("No clickable parent found")
+                or response == "Back Button (ImageButton) not found.")
+
+    async def wait_for(self, text, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            if self.find(text) is not None:
+                return True
+            await asyncio.sleep(0.1)
+        return False
+
+    def perform(self, command):
+        """Global actions, scrolling and clicks; returns the service's response text"""
+        if command == "goHome":
+            self.show("home")
+            return "Performed action: Home"
+        if command == "goBack":
+            self.back()
+            return "Performed action: Back"
+        if command == "showRecents":
+            return "Performed action: Show Recent Apps"
+        if command == "clickBackButton":
+            if self.screen not in ("delivery", "points"):
+                return "Back Button (ImageButton) not found."
+            self.show("menu")  # The top-left button of the delivery app opens its menu
+            return "Clicked Back Button."
+        if command in ("scrollUp", "scrollDown"):
+            return self.scroll(command)
+        return self.click(command)
+
+    def scroll(self, direction):
+        if self.screen != "points":
+            return "No scrollable node found"
+        last = max(len(self.points) - self.page_size, 0)
+        step = self.page_size if direction == "scrollDown" else -self.page_size
+        offset = min(max(self.offset + step, 0), last)
+        if offset == self.offset and not self.sticky_end:
+            return "No scrollable node found"  # ACTION_SCROLL_* failed at the end of the list
+        if offset != self.offset:
+            self.offset = offset
+            self.changed()
+        return f"Scroll {direction} completed successfully"
+
+    def click(self, text):
+        node = self.find(text)
+        if node is None:
+            return f"Command not found in UI: {text}"
+        if self.screen == "home" and text == "Peanut Food Delivery":
+            self.show("delivery")
+        elif self.screen == "menu" and text == "Direct":
+            self.offset = 0
+            self.show("points")
+        elif self.screen == "points" and text == "Go":
+            if self.selected:
+                self.trip, self.selected = self.selected, []
+                self.travel_task = asyncio.create_task(self.travel())
+        elif self.screen == "points" and text in self.points:
+            if text in self.selected:
+                self.selected.remove(text)
+            else:
+                self.selected.append(text)
+            self.changed()
+            return f"Command executed: {text} via parent node"
+        elif self.screen == "arrived" and text == "OK":
+            self.confirmed.set()
+        return f"Command executed: {text}"
+
+    def back(self):
+        self.show({"points": "menu", "menu": "delivery", "delivery": "home"}.get(self.screen, self.screen))
+
+    async def travel(self):
+        """Drive to every point of the trip, waiting on the OK screen at each"""
+        while self.trip:
+            self.show("travel")
+            await asyncio.sleep(self.travel_time)
+            self.confirmed = asyncio.Event()
+            self.show("arrived")
+            try:
+                await asyncio.wait_for(self.confirmed.wait(), self.confirm_time)
+            except asyncio.TimeoutError:
+                pass
+            self.trip.pop(0)
+        self.show("points")
+
+    # --- screen ---
+
+    def show(self, screen):
+        if screen != self.screen:
+            self.screen = screen
+            self.changed()
+
+    def changed(self):
+        """Push a uiChanged event like onAccessibilityEvent does"""
+        if self.writer is not None:
+            asyncio.get_running_loop().create_task(self.send(0, {"event": "uiChanged"}))
+
+    def nodes(self):
+        """(depth, class, text, clickable, scrollable, row) of every node on the screen, pre-order"""
+        nodes = [(0, "android.widget.FrameLayout", None, False, False, 0)]
+        if self.screen == "home":
+            labels = ["Clock", "Settings", "Peanut Food Delivery"]
+            nodes += [(1, "android.widget.TextView", label, True, False, i + 1) for i, label in enumerate(labels)]
+        elif self.screen == "delivery":
+            nodes += [(1, "android.widget.ImageButton", None, True, False, 0),
+                      (1, "android.widget.TextView", "Delivery", False, False, 1)]
+        elif self.screen == "menu":
+            labels = ["Direct", "Cruise", "Birthday"]
+            nodes += [(1, "android.widget.TextView", label, True, False, i + 1) for i, label in enumerate(labels)]
+        elif self.screen == "points":
+            nodes.append((1, "android.widget.ImageButton", None, True, False, 0))
+            nodes.append((1, "androidx.recyclerview.widget.RecyclerView", None, False, True, 1))
+            visible = self.points[self.offset:self.offset + self.page_size]
+            for row, point in enumerate(visible, start=1):
+                nodes.append((2, "android.widget.LinearLayout", None, True, False, row))
+                nodes.append((3, "android.widget.TextView", point, False, False, row))
+                if point in self.selected:
+                    nodes.append((3, "android.widget.CheckBox", "Selected", False, False, row))
+            nodes.append((1, "android.widget.Button", "Go", True, False, self.page_size + 1))
+        elif self.screen == "travel":
+            nodes.append((1, "android.widget.TextView", f"Delivering to {self.trip[0]}", False, False, 1))
+        elif self.screen == "arrived":
+            nodes += [(1, "android.widget.TextView", f"Arrived at {self.trip[0]}", False, False, 1),
+                      (1, "android.widget.Button", "OK", True, False, 2)]
+        return nodes
+
+    def find(self, text):
+        return next((node for node in self.nodes() if node[2] == text), None)
+
+    @staticmethod
+    def bounds(row):
+        return 0, row * ROW_HEIGHT, SCREEN_WIDTH, (row + 1) * ROW_HEIGHT
+
+    def node_json(self, node):
+        depth, class_name, text, clickable, scrollable, row = node
+        return {"class_name": class_name, "text": text, "clickable": clickable, "visible": True,
+                "scrollable": scrollable, "bounds": list(self.bounds(row))}
+
+    def dump(self):
+        """The screen as buildFullHierarchy writes it"""
+        nodes = self.nodes()
+        lines = []
+        for i, (depth, class_name, text, clickable, scrollable, row) in enumerate(nodes):
+            children = 0
+            for child in nodes[i + 1:]:
+                if child[0] <= depth:
+                    break
+                children += child[0] == depth + 1
+            left, top, right, bottom = self.bounds(row)
+            lines.append(
+                f"{' ' * (depth * 2)} Node: {class_name}, Text: {'null' if text is None else text}, "
+                f"Clickable: {str(clickable).lower()}, Visible: true, Children: {children}, "
+                f"Scrollable: {str(scrollable).lower()}, Bounds: [{left},{top}][{right},{bottom}]\n"
+            )
+        return "".join(lines)
+
+    @staticmethod
+    def fingerprint(hierarchy):
+        return hashlib.sha1(hierarchy.encode("utf-8")).hexdigest()[:16]
+
+    async def send_streamed(self, request_id, hierarchy, compress):
+        """Send the dump as FLAG_STREAM chunks followed by the final JSON frame"""
+        raw = hierarchy.encode("utf-8")
+        flags = FLAG_STREAM | (FLAG_COMPRESSED if compress else 0)
+        compressor = zlib.compressobj(1) if compress else None
+        sent = 0
+        for offset in range(0, len(raw), STREAM_CHUNK_SIZE):
+            chunk = raw[offset:offset + STREAM_CHUNK_SIZE]
+            if compressor is not None:
+                chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            await self.send_raw(flags, request_id, chunk)
+            sent += len(chunk)
+        if compressor is not None:
+            chunk = compressor.flush()
+            await self.send_raw(flags, request_id, chunk)
+            sent += len(chunk)
+        await self.send(request_id, {"response": "", "streamed": True, "bytes": len(raw),
+                                     "sent_bytes": sent, "fingerprint": self.fingerprint(hierarchy)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated Android device for the robot server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=12345)
+    parser.add_argument("--device-id", default="fake-device")
+    parser.add_argument("--points", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--travel-time", type=float, default=2.0)
+    parser.add_argument("--confirm-time", type=float, default=1.0)
+    parser.add_argument("--sticky-end", action="store_true")
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    device = FakeDevice(
+        host=args.host, port=args.port, device_id=args.device_id, points=args.points,
+        page_size=args.page_size, latency=args.latency, jitter=args.jitter,
+        travel_time=args.travel_time, confirm_time=args.confirm_time,
+        sticky_end=args.sticky_end, drop_rate=args.drop_rate,
+    )
+    try:
+        asyncio.run(device.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
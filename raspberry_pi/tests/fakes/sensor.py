@@ -0,0 +1,240 @@
+import argparse
+import asyncio
+import math
+import random
+import time
+
+from pymodbus.datastore import ModbusServerContext
+from pymodbus.datastore.context import ModbusBaseSlaveContext
+from pymodbus.server import ModbusTcpServer
+
+from src.registers import SOLAIR_RECORD, RECORD_COUNT_ADDRESS, RECORD_INDEX_ADDRESS, DATA_ADDRESS, RECORD_SIZE
+
+COMMAND_ADDRESS = 1  # Holding register written with START or STOP
+START = 11
+STOP = 12
+
+# Particle profiles: mean counts per minute of sampling for each channel
+PROFILES = {
+    "clean": {"um01": 2000, "um02": 900, "um03": 300, "um05": 120, "um07": 40, "um10": 15},
+    "dirty": {"um01": 40000, "um02": 18000, "um03": 6000, "um05": 2400, "um07": 800, "um10": 300},
+    "zero": {"um01": 0, "um02": 0, "um03": 0, "um05": 0, "um07": 0, "um10": 0},
+}
+
+class FakeSensor:
+    """
+    Simulated SOLAIR 1100LD serving Modbus TCP with the registers Sensor and MeasurementEngine
+    use: the command register 1 (11 starts, 12 stops), the record count (40024), the record
+    index (40025) and the 100 input registers from 30001. As on the real SOLAIR, 30001 always
+    holds the record selected through 40025; a stop stores the sample as a new record and
+    selects it. Live counts are only served with live_address, a separate block of input
+    registers that is not confirmed on hardware; live_address=DATA_ADDRESS serves them at 30001
+    while sampling. Counts follow a particle profile, with optional latency and faults, so the
+    sensor path can be tested and benchmarked on a plain Linux box.
+    """
+
+    def __init__(self, host="127.0.0.1", port=5020, slave=1, profile="clean", records=0, buffer_size=1000,
+                 start_delay=0.0, latency=0.0, jitter=0.0, error_rate=0.0, timeout_rate=0.0, hang_time=10.0,
+                 disconnect_after=None, live_address=None, seed=None):
+        self.host = host
+        self.port = port
+        self.slave = slave
+        self.profile = profile if isinstance(profile, dict) else PROFILES[profile]  # Counts per minute
+        self.buffer_size = buffer_size  # Records kept, oldest dropped first like the real buffer
+        self.start_delay = start_delay  # Seconds between the start command and counting
+        self.latency = latency  # Seconds added before every reply
+        self.jitter = jitter  # Extra random delay of up to this many seconds
+        self.error_rate = error_rate  # Chance of answering a request with a slave failure
+        self.timeout_rate = timeout_rate  # Chance of not answering for hang_time seconds
+        self.hang_time = hang_time
+        self.disconnect_after = disconnect_after  # Drop every connection after this many requests
+        self.live_address = live_address  # Input block with the counts of the sample in progress, None for none
+        self.random = random.Random(seed)
+
+        self.records = []  # Stored records as register lists, oldest first
+        self.index = 0  # Record loaded into the input registers
+        self.started = None  # time.monotonic() when counting began, None while idle
+        self.rates = {}  # Counts per second of the sample in progress
+        self.requests = 0  # Requests served over all connections
+        self.log = []  # (operation, address, value or count) of every request, in order
+        self.server = None
+
+        # Records already on the sensor, one a minute up to now, for backfill tests
+        now = time.time()
+        for i in range(records):
+            self.store(self.sample_counts(60), now - (records - i) * 60, 60)
+
+    # --- server ---
+
+    async def start(self):
+        """Start serving in the background; port 0 picks a free port"""
+        context = ModbusServerContext(slaves={self.slave: SolairContext(self)}, single=False)
+        self.server = ModbusTcpServer(context, address=(self.host, self.port))
+        await self.server.serve_forever(background=True)
+        self.port = self.server.transport.sockets[0].getsockname()[1]
+        print(f"Fake SOLAIR listening on {self.host}:{self.port}, slave {self.slave}")
+
+    async def run(self):
+        """Serve until cancelled"""
+        await self.start()
+        try:
+            await self.server.serving
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        if self.server is not None:
+            await self.server.shutdown()
+            self.server = None
+
+    def disconnect(self):
+        """Drop every client connection, like a switch or gateway restart"""
+        if self.server is not None:
+            for connection in list(self.server.active_connections.values()):
+                connection.close()
+
+    async def before_request(self, operation, address, value):
+        """Latency and faults, applied to every request"""
+        self.requests += 1
+        self.log.append((operation, address, value))
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.disconnect_after is not None and self.requests > self.disconnect_after:
+            self.disconnect_after = None
+            self.disconnect()
+            raise ConnectionError("Fake SOLAIR dropped the connection")
+        if self.random.random() < self.timeout_rate:
+            await asyncio.sleep(self.hang_time)
+        if self.random.random() < self.error_rate:
+            raise RuntimeError("Fake SOLAIR failure")
+
+    # --- registers ---
+
+    def holding(self, address):
+        if address == RECORD_COUNT_ADDRESS:
+            return len(self.records)
+        if address == RECORD_INDEX_ADDRESS:
+            return self.index
+        if address == COMMAND_ADDRESS:
+            return START if self.started is not None else STOP
+        return 0
+
+    def write(self, address, value):
+        if address == COMMAND_ADDRESS:
+            if value == START:
+                self.begin()
+            elif value == STOP:
+                self.end()
+        elif address == RECORD_INDEX_ADDRESS:
+            if value >= len(self.records):
+                raise IndexError(f"No record {value}")
+            self.index = value
+
+    def in_block(self, start, address, count):
+        return start is not None and start <= address and address + count <= start + RECORD_SIZE
+
+    def inputs(self, address, count):
+        if self.in_block(self.live_address, address, count) and self.started is not None:
+            registers, start = self.live(), self.live_address
+        elif self.in_block(DATA_ADDRESS, address, count):
+            registers, start = self.records[self.index] if self.records else [0] * RECORD_SIZE, DATA_ADDRESS
+        else:
+            registers, start = [0] * RECORD_SIZE, self.live_address  # Live block between samples
+        return registers[address - start:address - start + count]
+
+    # --- sampling ---
+
+    def begin(self):
+        self.started = time.monotonic() + self.start_delay
+        # One rate per sample, drawn around the profile, so live counts only grow
+        self.rates = {channel: max(self.random.gauss(rate, math.sqrt(rate)), 0) / 60
+                      for channel, rate in self.profile.items()}
+
+    def elapsed(self):
+        return max(time.monotonic() - self.started, 0)
+
+    def live(self):
+        elapsed = self.elapsed()
+        counts = {channel: round(rate * elapsed) for channel, rate in self.rates.items()}
+        return SOLAIR_RECORD.encode(dict(counts, timestamp=int(time.time()), sample_time=int(elapsed)))
+
+    def end(self):
+        if self.started is None:
+            return
+        registers = self.live()
+        self.started = None
+        self.records.append(registers)
+        del self.records[:-self.buffer_size]
+        self.index = len(self.records) - 1
+
+    def sample_counts(self, seconds):
+        return {channel: max(round(self.random.gauss(rate, math.sqrt(rate)) * seconds / 60), 0)
+                for channel, rate in self.profile.items()}
+
+    def store(self, counts, timestamp, sample_time):
+        """Add a record to the buffer, e.g. one taken before the simulator started"""
+        self.records.append(SOLAIR_RECORD.encode(dict(counts, timestamp=int(timestamp), sample_time=sample_time)))
+        del self.records[:-self.buffer_size]
+        self.index = len(self.records) - 1
+
+
+class SolairContext(ModbusBaseSlaveContext):
+    """Slave context mapping Modbus requests onto a FakeSensor"""
+
+    def __init__(self, sensor):
+        self.sensor = sensor
+
+    def reset(self):
+        pass
+
+    def validate(self, fc_as_hex, address, count=1):
+        kind = self.decode(fc_as_hex)
+        if kind == "h":
+            return 0 <= address and address + count <= RECORD_INDEX_ADDRESS + 1
+        if kind == "i":
+            return any(self.sensor.in_block(start, address, count) for start in (DATA_ADDRESS, self.sensor.live_address))
+        return False
+
+    async def async_getValues(self, fc_as_hex, address, count=1):
+        await self.sensor.before_request("read", address, count)
+        if self.decode(fc_as_hex) == "i":
+            return self.sensor.inputs(address, count)
+        return [self.sensor.holding(address + i) for i in range(count)]
+
+    async def async_setValues(self, fc_as_hex, address, values):
+        await self.sensor.before_request("write", address, values[0])
+        for i, value in enumerate(values):
+            self.sensor.write(address + i, value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated SOLAIR 1100LD on Modbus TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5020)
+    parser.add_argument("--slave", type=int, default=1)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="clean")
+    parser.add_argument("--records", type=int, default=0)
+    parser.add_argument("--start-delay", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--live-address", type=int, default=None,
+                        help="Input register (e.g. 30101) serving the live counts, none by default")
+    args = parser.parse_args()
+
+    sensor = FakeSensor(
+        host=args.host, port=args.port, slave=args.slave, profile=args.profile, records=args.records,
+        start_delay=args.start_delay, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, timeout_rate=args.timeout_rate,
+        live_address=args.live_address - 30001 if args.live_address is not None else None,
+    )
+    try:
+        asyncio.run(sensor.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
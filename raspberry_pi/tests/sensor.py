@@ -11,6 +11,16 @@ def test_sensor():
     if data:
         print(f"Measurement data: {data}")
     print("Done")
-    
+
+def test_backfill():
+    sensor = Sensor()
+
+    # Read back the last records stored on the sensor
+    records = sensor.backfill(limit=5)
+    for record in records:
+        print(f"Stored record: {record}")
+    print(f"Read {len(records)} records")
+
 if __name__ == "__main__":
-   test_sensor()
\ No newline at end of file
+   test_sensor()
+   test_backfill()
\ No newline at end of file